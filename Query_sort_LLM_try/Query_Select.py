@@ -1,68 +1,110 @@
+import argparse
+import numpy as np
 import pandas as pd
-from datetime import timedelta
 
-def process_excel(input_file, output_file):
+import profiler
+from table_io import is_columnar, read_table, write_table
+
+INSTRUCTION = "【下发指令】"
+
+def load_process_file(input_file):
+    """读取original_process的输出，并把B列转换为时间格式"""
+    if is_columnar(input_file):
+        # 列式文件通常已把B列存为时长类型，只读取需要的列
+        with profiler.stage('read_table'):
+            df = read_table(input_file, columns=['A', 'B', 'C', 'D'])
+        df = df.dropna(subset=['C'])
+        # 非typed方式写出的文件里B列仍是"M:S"字符串，同样转换
+        if not pd.api.types.is_timedelta64_dtype(df['B']):
+            with profiler.stage('parse_time'):
+                df['B'] = pd.to_timedelta('00:' + df['B'].astype(str))
+        return df
+
     # 读取Excel文件
-    df = pd.read_excel(input_file)
+    with profiler.stage('read_excel'):
+        df = pd.read_excel(input_file)
     df = df.dropna(subset=['C'])
     
-    print(df['B'][1],type(df['B'][1]))
     # 转换B列为时间格式（hh:mm:ss）
-    df['B'] = pd.to_timedelta('00:' + df['B'].astype(str))  # 在前面加上"00:"补全小时部分
-    print(df['B'][1],type(df['B'][1]))
+    with profiler.stage('parse_time'):
+        df['B'] = pd.to_timedelta('00:' + df['B'].astype(str))  # 在前面加上"00:"补全小时部分
+    return df
 
-    # 按A列值聚类
-    grouped = df.groupby('A')
+def iter_sessions(df, window_seconds=60):
+    """
+    按A列（对局）分组，逐局返回 (对局key, 窗口内的指令行, 符合条件的发言行)
+    符合条件：非指令，且前window_seconds秒内同一局有指令
+    """
+    window = np.timedelta64(window_seconds, 's')
     
-    processed_data = []
-    
-    for abs_value, group in grouped:
+    # 按A列值聚类
+    for game, group in df.groupby('A'):
         # 按B列去重，保留第一个出现的行
         deduped_group = group.drop_duplicates(subset='B', keep='first')
+        is_instruction = (deduped_group['D'] == INSTRUCTION).to_numpy()
         
         # 检查子列表中是否有D列不是"【下发指令】"的行
-        has_non_instruction = any(deduped_group['D'] != "【下发指令】")
-        
-        if not has_non_instruction:
+        if is_instruction.all() or not is_instruction.any():
             continue  # 跳过这个子列表
         
-        # 找出所有非"【下发指令】"的行
-        non_instruction_rows = deduped_group[deduped_group['D'] != "【下发指令】"].copy()
+        instructions = deduped_group[is_instruction].sort_values('B', kind='stable')
+        candidates = deduped_group[~is_instruction]
+        instruction_times = instructions['B'].to_numpy()
+        candidate_times = candidates['B'].to_numpy()
         
-        # 存储符合条件的行（非指令且前30秒内有指令）
-        valid_rows = []
+        # 二分查找每条发言前window秒内 [t - window, t) 的指令区间
+        lo = np.searchsorted(instruction_times, candidate_times - window, side='left')
+        hi = np.searchsorted(instruction_times, candidate_times, side='left')
+        valid = hi > lo
+        if not valid.any():
+            continue
         
-        for idx, row in non_instruction_rows.iterrows():
-            current_time = row['B']
-            time_threshold = current_time - timedelta(seconds=60)
-            
-            # 查找同一组中在当前时间前30秒内的指令
-            instructions_in_window = deduped_group[
-                (deduped_group['D'] == "【下发指令】") & 
-                (deduped_group['B'] >= time_threshold) & 
-                (deduped_group['B'] < current_time)
-            ]
-            
-            # 如果前30秒内有指令，则保留该行
-            if not instructions_in_window.empty:
-                valid_rows.append(row)
+        # 只保留落在某条有效发言窗口内的指令，作为该局的指令时间线
+        coverage = np.zeros(len(instruction_times) + 1, dtype=np.int64)
+        np.add.at(coverage, lo[valid], 1)
+        np.add.at(coverage, hi[valid], -1)
+        in_window = np.cumsum(coverage[:-1]) > 0
         
-        # 如果有符合条件的行，加入最终结果
-        if valid_rows:
-            processed_data.extend(valid_rows)
+        profiler.mark('first_row')
+        yield game, instructions[in_window], candidates[valid]
+
+def select_rows(df, window_seconds=60):
+    """返回所有符合条件的发言行（顺序与逐局筛选一致）"""
+    selected = [rows for _, _, rows in iter_sessions(df, window_seconds)]
+    if not selected:
+        return df.iloc[0:0]
+    return pd.concat(selected)
+
+def process_excel(input_file, output_file):
+    df = load_process_file(input_file)
+
+    with profiler.stage('select'):
+        result_df = select_rows(df)
     
+    # 没有符合条件的数据时也写出同样列的空表，避免下游阶段读到上一次留下的旧文件
+    if result_df.empty:
+        print("没有符合条件的数据")
+
     # 创建结果DataFrame
-    if processed_data:
-        result_df = pd.DataFrame(processed_data)
+    if is_columnar(output_file):
+        with profiler.stage('write_table'):
+            write_table(result_df, output_file)
+    else:
+        result_df = result_df.copy()
         # 转换时间列回字符串格式以便更好显示
         result_df['B'] = result_df['B'].astype(str).str.extract(r'(\d+:\d{2}:\d{2})')[0]
         # 保存到新Excel文件
-        result_df.to_excel(output_file, index=False)
-        print(f"处理完成，结果已保存到 {output_file}")
-    else:
-        print("没有符合条件的数据")
+        with profiler.stage('write_excel'):
+            result_df.to_excel(output_file, index=False)
+    print(f"处理完成，结果已保存到 {output_file}")
 
 # 使用示例
-input_file = '0717_process.xlsx'  # 替换为你的输入文件路径
-output_file = '0717_select.xlsx'  # 替换为你想要的输出文件路径
-process_excel(input_file, output_file)
\ No newline at end of file
+if __name__ == "__main__":
+    parser = profiler.add_profile_args(argparse.ArgumentParser(description='筛选指令后出现的玩家发言'))
+    args = parser.parse_args()
+    profiler.enable_from_args(args, 'Query_Select')
+
+    input_file = '0717_process.xlsx'  # 替换为你的输入文件路径
+    output_file = '0717_select.xlsx'  # 替换为你想要的输出文件路径
+    process_excel(input_file, output_file)
+    profiler.finish()
\ No newline at end of file
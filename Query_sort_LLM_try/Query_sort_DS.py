@@ -1,3 +1,4 @@
+import argparse
 import requests
 from openai import OpenAI
 import json
@@ -6,20 +7,24 @@ from openpyxl import Workbook
 import openpyxl
 from openpyxl.utils import get_column_letter
 
+import profiler
+from Query_sort_DS_enhance import log_validation, validate_labels
+
 def infer(system_prompt, user_query, token=None, model="deepseek-chat"):
     # 初始化OpenAI客户端
     client = OpenAI(api_key=token if token else "", base_url="https://api.deepseek.com/v1")
     
     try:
         # 调用DeepSeek API
-        response = client.chat.completions.create(
-            model=model,
-            messages=[
-                {"role": "system", "content": system_prompt},
-                {"role": "user", "content": user_query},
-            ],
-            stream=False
-        )
+        with profiler.stage('api_call'):
+            response = client.chat.completions.create(
+                model=model,
+                messages=[
+                    {"role": "system", "content": system_prompt},
+                    {"role": "user", "content": user_query},
+                ],
+                stream=False
+            )
         
         # 获取并处理响应内容
         result = response.choices[0].message.content
@@ -37,19 +42,22 @@ def save_excel(save_path, title_list, content_list):
     ws_trg = wb_trg.active
     ws_trg.append(title_list)
     for content in content_list:
-        ws_trg.append([content])
+        ws_trg.append(list(content))
     if os.path.exists(save_path):
         os.remove(save_path)
-    wb_trg.save(save_path)
+    with profiler.stage('save_excel'):
+        wb_trg.save(save_path)
     wb_trg.close()
 
 
 def main(source_file, system_prompt, token=None, model=None, save_path=None):
-    wb_source = openpyxl.load_workbook(source_file)
+    with profiler.stage('load_source'):
+        wb_source = openpyxl.load_workbook(source_file)
     ws_source = wb_source.active  # 获取活动工作表
 
     # add data
     data = []
+    queries = []
     for row in ws_source.iter_rows():  # 遍历每一行
         query = ""
         response = ""
@@ -65,13 +73,23 @@ def main(source_file, system_prompt, token=None, model=None, save_path=None):
             
         response = infer(system_prompt, query, token, model) if query else ""
         if row_index > 1:
+            # 首行耗时只算到第一个数据行（跳过标题行）的推理完成
+            profiler.mark('first_row')
             print(f"{query} -> {response}")
             data.append(response)
-    title_list = ["回复"]
-    save_excel(save_path, title_list, data)
+            queries.append(query)
+    # 校验回复：标签为1~5，状态为 ok / invalid / failed / empty（空查询）
+    labels, statuses = validate_labels(data, queries)
+    log_validation(statuses)
+    title_list = ["回复", "标签", "状态"]
+    save_excel(save_path, title_list, zip(data, labels, statuses))
     return
 
 if __name__ == "__main__":
+    parser = profiler.add_profile_args(argparse.ArgumentParser(description='使用DeepSeek对查询进行分类'))
+    args = parser.parse_args()
+    profiler.enable_from_args(args, 'Query_sort_DS')
+
     # prompt
     system_prompt = """
     你是一个判断moba游戏玩家语音情绪意图语义的AI专家，请判断以下句子的语义是：1、消极且明确表达AI不听指挥；2、其他消极言论；3、中性；4、积极，直接输出数字，不要输出其他内容。
@@ -125,4 +143,5 @@ if __name__ == "__main__":
     # 输出excel路径
     save_path = "0517_select_review.xlsx"
     
-    main(source_file, system_prompt, token, model, save_path)
\ No newline at end of file
+    main(source_file, system_prompt, token, model, save_path)
+    profiler.finish()
\ No newline at end of file
@@ -1,24 +1,137 @@
-import requests
-from openai import OpenAI
-import json
+import argparse
+import hashlib
 import os
 from openpyxl import Workbook
 import openpyxl
 from openpyxl.utils import get_column_letter
 import logging
+import re
+import sys
+import threading
 from typing import List, Tuple, Optional
 import time
+import unicodedata
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+
+import cost_estimator
+import profiler
+from table_io import is_columnar, read_table, write_table
 
 # 配置日志
 logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
 logger = logging.getLogger(__name__)
 
+# 会话模式下追加到系统prompt末尾的说明
+SESSION_INSTRUCTION = (
+    "\n\n下面会给出同一局游戏中最近的指令时间线，以及若干条需要判断的玩家发言（每条带编号）。"
+    "请结合指令时间线，按上面的规则分别判断每条发言，每条一行，格式为'编号: 数字'，不要输出其他内容。"
+)
+
+# 修复无效回复时追加到系统prompt末尾的严格说明（追加在末尾，不影响前缀缓存）
+STRICT_INSTRUCTION = (
+    "\n\n注意：只允许输出一个阿拉伯数字（1、2、3、4 或 5），"
+    "不要输出标点、空格、解释或其他任何文字。"
+)
+
+VALID_LABELS = ('1', '2', '3', '4', '5')
+_LABEL_PATTERN = re.compile(r'(?<![0-9])[1-5](?![0-9])')
+
+def format_game_time(value) -> str:
+    """把时间（timedelta）格式化为 MM:SS"""
+    total_seconds = int(value.total_seconds())
+    return '%02d:%02d' % (total_seconds // 60, total_seconds % 60)
+
+def build_session_query(instructions, lines) -> str:
+    """组装会话请求：先给出指令时间线，再列出所有待判断的发言（lines中不应含空发言，编号与行序一一对应）"""
+    parts = ["【指令时间线】"]
+    for _, row in instructions.iterrows():
+        parts.append(f"{format_game_time(row['B'])} 玩家{row['C']} {row['D']}")
+    parts.append("【待判断发言】")
+    for i, (_, row) in enumerate(lines.iterrows(), 1):
+        parts.append(f"{i}. [{format_game_time(row['B'])} 玩家{row['C']}] {str(row['D']).strip()}")
+    return "\n".join(parts)
+
+def parse_numbered_labels(text: str, count: int) -> List[str]:
+    """解析 '编号: 标签' 格式的批量回复，缺失的编号返回空字符串"""
+    labels = [""] * count
+    for line in text.splitlines():
+        match = re.match(r'\s*(\d+)\s*[:：.、]\s*(\S+)', line)
+        if match:
+            idx = int(match.group(1)) - 1
+            if 0 <= idx < count and not labels[idx]:
+                labels[idx] = match.group(2)
+    return labels
+
+def canonical_examples(examples: List[Tuple[str, str]]) -> List[Tuple[str, str]]:
+    """示例去重并按 (标签, query) 排序，标注文件的行序变化不会改变prompt"""
+    return sorted({(q.strip(), str(l).strip()) for q, l in examples if q.strip()},
+                  key=lambda example: (example[1], example[0]))
+
+def prompt_version(prompt: str) -> str:
+    """prompt内容的短哈希，用于区分不同版本的prompt"""
+    return hashlib.sha256(prompt.encode('utf-8')).hexdigest()[:12]
+
+def validate_label(response) -> Tuple[str, str]:
+    """
+    把模型回复映射到标签 1~5，返回 (标签, 状态)
+    状态：ok 有效；invalid 有回复但无法确定唯一标签；failed 调用失败（空回复）
+    回复中只出现一个独立的 1~5 数字时取该数字，如 "1。"、"标签：3"、"4（积极夸赞）"
+    """
+    text = "" if response is None or response != response else str(response).strip()
+    if not text:
+        return "", "failed"
+    candidates = set(_LABEL_PATTERN.findall(unicodedata.normalize('NFKC', text)))
+    if len(candidates) == 1:
+        return candidates.pop(), "ok"
+    return "", "invalid"
+
+def _is_query(value) -> bool:
+    """单元格中是否有非空查询"""
+    return not (value is None or value != value or not str(value).strip())
+
+def validate_labels(responses, queries=None) -> Tuple[List[str], List[str]]:
+    """批量校验，返回 (标签列表, 状态列表)；给出按行对应的 queries 时，空查询的行状态为 empty"""
+    pairs = [validate_label(response) for response in responses]
+    if queries is not None:
+        pairs = [("", "empty") if not _is_query(query) else pair for pair, query in zip(pairs, queries)]
+    return [label for label, _ in pairs], [status for _, status in pairs]
+
+def log_validation(statuses, title: str = "校验结果"):
+    """输出各状态的行数"""
+    counts = Counter(statuses)
+    logger.info(f"{title}: 有效 {counts['ok']}, 无效 {counts['invalid']}, 失败 {counts['failed']}"
+                + (f", 空查询 {counts['empty']}" if counts['empty'] else ""))
+    return counts
+
+def load_queries(source_file: str, query_col: str) -> List[str]:
+    """按行读取查询列（不含标题行），空单元格返回空字符串；Excel按列字母，列式格式按列名"""
+    if is_columnar(source_file):
+        values = read_table(source_file, columns=[query_col])[query_col]
+    else:
+        col_idx = openpyxl.utils.column_index_from_string(query_col)
+        wb = openpyxl.load_workbook(source_file, read_only=True)
+        values = [row[col_idx - 1] if len(row) >= col_idx else None
+                  for row in wb.active.iter_rows(min_row=2, values_only=True)]
+        wb.close()
+    return ["" if value is None or value != value else str(value).strip() for value in values]
+
 class QueryClassifier:
     """查询分类器类"""
     
-    def __init__(self, api_key: str, base_url: str = "https://api.deepseek.com/v1", model: str = "deepseek-chat"):
-        self.client = OpenAI(api_key=api_key, base_url=base_url)
+    def __init__(self, api_key: str, base_url: str = "https://api.deepseek.com/v1", model: str = "deepseek-chat",
+                 client=None):
+        if client is None:
+            from openai import OpenAI
+            client = OpenAI(api_key=api_key, base_url=base_url)
+        self.client = client
         self.model = model
+        self.prompt_version = ""
+        self.api_calls = 0  # 累计API请求次数（含重试）
+        # 累计用量，包括DeepSeek返回的前缀缓存命中/未命中token数
+        self.usage = {'prompt_tokens': 0, 'completion_tokens': 0,
+                      'prompt_cache_hit_tokens': 0, 'prompt_cache_miss_tokens': 0}
+        self._stats_lock = threading.Lock()
         
     def read_system_prompt(self, file_path: str) -> str:
         """从txt文件中读取系统prompt"""
@@ -36,16 +149,20 @@ class QueryClassifier:
         """调用API进行推理，支持重试机制"""
         for attempt in range(max_retries):
             try:
-                response = self.client.chat.completions.create(
-                    model=self.model,
-                    messages=[
-                        {"role": "system", "content": system_prompt},
-                        {"role": "user", "content": user_query},
-                    ],
-                    stream=False,
-                    timeout=30
-                )
+                with self._stats_lock:
+                    self.api_calls += 1
+                with profiler.stage('api_call'):
+                    response = self.client.chat.completions.create(
+                        model=self.model,
+                        messages=[
+                            {"role": "system", "content": system_prompt},
+                            {"role": "user", "content": user_query},
+                        ],
+                        stream=False,
+                        timeout=30
+                    )
                 
+                self._record_usage(getattr(response, 'usage', None))
                 result = response.choices[0].message.content
                 return result.strip() if result else ""
                 
@@ -57,10 +174,29 @@ class QueryClassifier:
                     logger.error(f"API调用最终失败: {e}")
                     return ""
     
+    def _record_usage(self, usage):
+        """累计一次调用的token用量"""
+        if usage is None:
+            return
+        with self._stats_lock:
+            for key in self.usage:
+                self.usage[key] += getattr(usage, key, 0) or 0
+
+    def log_usage(self):
+        """输出累计用量和前缀缓存命中率"""
+        hit = self.usage['prompt_cache_hit_tokens']
+        miss = self.usage['prompt_cache_miss_tokens']
+        rate = hit / (hit + miss) if hit + miss else 0.0
+        logger.info(f"prompt版本 {self.prompt_version or '-'}: API调用 {self.api_calls} 次, "
+                    f"prompt {self.usage['prompt_tokens']} tokens (缓存命中 {hit}, 未命中 {miss}, 命中率 {rate:.1%}), "
+                    f"completion {self.usage['completion_tokens']} tokens")
+        return dict(self.usage, api_calls=self.api_calls, prompt_version=self.prompt_version, cache_hit_rate=rate)
+
     def get_training_examples(self, annotation_file: str, query_col: str = 'C', label_col: str = 'D') -> List[Tuple[str, str]]:
         """从标注文件中读取训练示例"""
         try:
-            wb = openpyxl.load_workbook(annotation_file)
+            with profiler.stage('load_examples'):
+                wb = openpyxl.load_workbook(annotation_file)
             ws = wb.active
             examples = []
             
@@ -81,25 +217,38 @@ class QueryClassifier:
             return []
     
     def create_enhanced_prompt(self, base_prompt: str, examples: List[Tuple[str, str]]) -> str:
-        """增强prompt，添加训练示例"""
+        """
+        增强prompt，添加训练示例
+        固定的系统prompt在前、示例按规范顺序排列在后，每条query只放在user消息里，
+        使各次请求共享尽可能长的相同前缀，命中服务端的前缀缓存
+        """
+        examples = canonical_examples(examples)
         if not examples:
             logger.warning("没有训练示例，使用原始prompt")
+            self.prompt_version = prompt_version(base_prompt)
             return base_prompt
             
-        example_section = "\n\n下面是一些标注好的示例（格式为'query -> label'），请参考这些示例进行判断：\n"
-        for query, label in examples:
-            example_section += f'"{query}" -> {label}\n'
-        
-        return base_prompt + example_section
+        example_lines = [f'"{query}" -> {label}' for query, label in examples]
+        enhanced = (base_prompt
+                    + "\n\n下面是一些标注好的示例（格式为'query -> label'），请参考这些示例进行判断：\n"
+                    + "\n".join(example_lines) + "\n")
+        self.prompt_version = prompt_version(enhanced)
+        logger.info(f"prompt版本: {self.prompt_version}（{len(examples)} 个示例）")
+        return enhanced
     
-    def process_queries(self, source_file: str, query_col: str = 'F', enhanced_prompt: str = "") -> List[str]:
-        """处理查询文件"""
+    def process_queries(self, source_file: str, query_col: str = 'F', enhanced_prompt: str = "") -> Optional[List[str]]:
+        """处理查询文件，失败时返回None"""
+        if is_columnar(source_file):
+            return self.process_query_table(source_file, query_col, enhanced_prompt)
         try:
-            wb_source = openpyxl.load_workbook(source_file)
+            with profiler.stage('load_source'):
+                wb_source = openpyxl.load_workbook(source_file)
             ws_source = wb_source.active
             results = []
             
             query_col_idx = openpyxl.utils.column_index_from_string(query_col)
+            if query_col_idx > ws_source.max_column:
+                raise ValueError(f"查询列 {query_col} 不存在（{source_file} 只有 {ws_source.max_column} 列）")
             
             for row_idx, row in enumerate(ws_source.iter_rows(), 1):
                 if row_idx == 1:  # 跳过标题行
@@ -115,6 +264,7 @@ class QueryClassifier:
                 
                 response = self.infer(enhanced_prompt, query)
                 results.append(response)
+                profiler.mark('first_row')
                 
                 # 添加延迟避免API限制
                 time.sleep(0.5)
@@ -123,22 +273,171 @@ class QueryClassifier:
             
         except Exception as e:
             logger.error(f"处理查询文件失败: {e}")
-            return []
+            return None
     
-    def save_results(self, save_path: str, results: List[str], title: str = "回复"):
-        """保存结果到Excel文件"""
+    def process_query_table(self, source_file: str, query_col: str = 'D', enhanced_prompt: str = "") -> Optional[List[str]]:
+        """处理列式查询文件（Parquet/Arrow），只读取查询列，失败时返回None"""
         try:
-            wb = Workbook()
-            ws = wb.active
-            ws.append([title])
-            
-            for result in results:
-                ws.append([result])
+            with profiler.stage('load_source'):
+                queries = read_table(source_file, columns=[query_col])[query_col]
+            results = []
+
+            for row_idx, query in enumerate(queries, 2):
+                query = "" if query is None or query != query else str(query).strip()
+                if not query:
+                    results.append("")
+                    continue
+
+                logger.info(f"处理查询 {row_idx}: {query[:50]}...")
+                results.append(self.infer(enhanced_prompt, query))
+                profiler.mark('first_row')
+
+                # 添加延迟避免API限制
+                time.sleep(0.5)
+
+            return results
+
+        except Exception as e:
+            logger.error(f"处理查询文件失败: {e}")
+            return None
+
+    def classify_sessions(self, sessions, enhanced_prompt: str = "", max_lines_per_call: int = 30):
+        """
+        按对局分组分类：每局只发送一次指令时间线，并在同一个请求里判断该局的所有候选发言
+        sessions: Query_Select.iter_sessions 的输出
+        返回带 "回复" 列的候选发言DataFrame
+        """
+        import pandas as pd
+
+        session_prompt = enhanced_prompt + SESSION_INSTRUCTION
+        results = []
+        n_sessions = 0
+        n_lines = 0
+        calls_before = self.api_calls
+
+        for game, instructions, lines in sessions:
+            n_sessions += 1
+            lines = lines.sort_values('B', kind='stable')
+            for start in range(0, len(lines), max_lines_per_call):
+                chunk = lines.iloc[start:start + max_lines_per_call].copy()
+                # 空发言不编号、不请求，直接标为empty；编号只对应非空发言
+                is_query = chunk['D'].map(_is_query).to_numpy(dtype=bool)
+                asked = chunk[is_query]
+                labels = [""] * len(chunk)
+                if len(asked):
+                    query = build_session_query(instructions, asked)
+                    logger.info(f"处理对局 {game}: {len(asked)} 条发言")
+
+                    asked_labels = parse_numbered_labels(self.infer(session_prompt, query), len(asked))
+                    # 批量回复中缺失或无效的行，退回逐条判断
+                    for i, label in enumerate(asked_labels):
+                        if validate_label(label)[1] != "ok":
+                            asked_labels[i] = self.infer(enhanced_prompt, str(asked.iloc[i]['D']).strip())
+                    for pos, label in zip(is_query.nonzero()[0], asked_labels):
+                        labels[pos] = label
+
+                chunk['回复'] = labels
+                chunk['标签'], chunk['状态'] = validate_labels(labels, chunk['D'])
+                results.append(chunk)
+                n_lines += len(asked)
+                if len(asked):
+                    profiler.mark('first_row')
+
+        calls = self.api_calls - calls_before
+        if n_lines:
+            logger.info(f"会话模式: {n_sessions} 局, 分类 {n_lines} 行, API调用 {calls} 次, "
+                        f"平均每行 {calls / n_lines:.3f} 次")
+        if not results:
+            return pd.DataFrame(columns=['A', 'B', 'C', 'D', '回复', '标签', '状态'])
+        result_df = pd.concat(results)
+        log_validation(result_df['状态'])
+        return result_df
+
+    def requery(self, queries: List[str], strict_prompt: str, workers: int = 4) -> List[str]:
+        """并发地重新请求一组查询，返回与输入顺序一致的回复"""
+        if not queries:
+            return []
+        with ThreadPoolExecutor(max_workers=max(1, workers)) as pool:
+            return list(pool.map(lambda query: self.infer(strict_prompt, query), queries))
+
+    def repair_results(self, results_path: str, source_file: str, query_col: str,
+                       enhanced_prompt: str, workers: int = 4):
+        """
+        只对结果文件中无效/失败的行重新请求（使用更严格的prompt），并原地更新结果文件
+        结果文件中带有查询列时（会话模式、分片合并的输出）直接使用，否则按行从源文件读取
+        """
+        with profiler.stage('load_results'):
+            result_df = read_table(results_path)
+        responses = ["" if value is None or value != value else str(value).strip()
+                     for value in result_df['回复']]
+        if query_col in result_df.columns:
+            queries = ["" if value is None or value != value else str(value).strip()
+                       for value in result_df[query_col]]
+        else:
+            queries = load_queries(source_file, query_col)
+        if len(queries) != len(responses):
+            raise ValueError(f"结果文件有 {len(responses)} 行，源文件有 {len(queries)} 行，无法按行对应")
+
+        labels, statuses = validate_labels(responses, queries)
+        log_validation(statuses, "修复前")
+
+        bad_rows = [i for i, status in enumerate(statuses) if status in ("invalid", "failed")]
+        calls_before = self.api_calls
+        with profiler.stage('requery'):
+            retried = self.requery([queries[i] for i in bad_rows],
+                                   enhanced_prompt + STRICT_INSTRUCTION, workers)
+        for i, response in zip(bad_rows, retried):
+            responses[i] = response
+            labels[i], statuses[i] = validate_label(response)
+        logger.info(f"重新请求 {len(bad_rows)} 行, API调用 {self.api_calls - calls_before} 次")
+        counts = log_validation(statuses, "修复后")
+
+        result_df['回复'] = responses
+        result_df['标签'] = labels
+        result_df['状态'] = statuses
+        with profiler.stage('save_results'):
+            write_table(result_df, results_path)
+        logger.info(f"结果已更新: {results_path}")
+        return counts
+
+    def save_session_results(self, save_path: str, result_df):
+        """保存会话模式结果（A-D列 + 回复列）；列式格式保留时长类型的B列，Excel转换为 MM:SS"""
+        result_df = result_df.copy()
+        if not is_columnar(save_path):
+            result_df['B'] = result_df['B'].map(format_game_time)
+        if os.path.dirname(save_path):
+            os.makedirs(os.path.dirname(save_path), exist_ok=True)
+        with profiler.stage('save_results'):
+            write_table(result_df.reset_index(drop=True), save_path)
+        logger.info(f"结果已保存到: {save_path}")
+
+    def save_results(self, save_path: str, results: List[str], title: str = "回复", queries=None):
+        """
+        保存结果：原始回复、校验后的标签和状态；按扩展名写为Excel或列式格式
+        queries 为按行对应的查询，空查询的行状态记为 empty
+        """
+        try:
+            labels, statuses = validate_labels(results, queries)
+            log_validation(statuses)
             
             # 确保目录存在
-            os.makedirs(os.path.dirname(save_path), exist_ok=True)
+            if os.path.dirname(save_path):
+                os.makedirs(os.path.dirname(save_path), exist_ok=True)
             
-            wb.save(save_path)
+            if is_columnar(save_path):
+                import pandas as pd
+                with profiler.stage('save_results'):
+                    write_table(pd.DataFrame({title: results, "标签": labels, "状态": statuses}), save_path)
+                logger.info(f"结果已保存到: {save_path}")
+                return
+
+            wb = Workbook()
+            ws = wb.active
+            ws.append([title, "标签", "状态"])
+            for row in zip(results, labels, statuses):
+                ws.append(list(row))
+            with profiler.stage('save_results'):
+                wb.save(save_path)
             wb.close()
             logger.info(f"结果已保存到: {save_path}")
             
@@ -146,8 +445,83 @@ class QueryClassifier:
             logger.error(f"保存结果失败: {e}")
             raise
 
+def build_classifier(config):
+    """按配置创建分类器并组装增强prompt，返回 (classifier, enhanced_prompt)"""
+    # 初始化分类器
+    client = None
+    if config.get('stub'):
+        from stub_backend import StubClient
+        client = StubClient(config.get('stub_latency', 0.0))
+    classifier = QueryClassifier(config['token'], model=config['model'], client=client)
+    
+    # 读取系统prompt
+    system_prompt = classifier.read_system_prompt(config['prompt_file'])
+    
+    # 读取训练示例
+    training_examples = classifier.get_training_examples(
+        config['annotation_file'], 
+        config.get('query_col_annotation', 'C'), 
+        config.get('label_col_annotation', 'D')
+    )
+    
+    # 增强系统prompt
+    enhanced_prompt = classifier.create_enhanced_prompt(system_prompt, training_examples)
+    return classifier, enhanced_prompt
+
+def run(config):
+    """按配置执行完整的分类流程，处理查询文件失败时不保存结果并返回False"""
+    classifier, enhanced_prompt = build_classifier(config)
+    
+    if config.get('repair'):
+        # 修复模式：只重新请求已有结果中无效/失败的行
+        # 会话模式的结果文件自带发言列D
+        query_col = 'D' if config.get('session_mode') else config['query_col']
+        classifier.repair_results(config['save_path'], config['source_file'], query_col,
+                                  enhanced_prompt, config.get('repair_workers', 4))
+        classifier.log_usage()
+        logger.info("处理完成！")
+        return True
+
+    if config.get('session_mode'):
+        # 会话模式：输入为original_process的输出，按对局分组分类
+        from Query_Select import load_process_file, iter_sessions
+        df = load_process_file(config['source_file'])
+        sessions = iter_sessions(df, config.get('session_window', 60))
+        result_df = classifier.classify_sessions(
+            sessions, enhanced_prompt, config.get('session_max_lines', 30))
+        classifier.save_session_results(config['save_path'], result_df)
+        classifier.log_usage()
+        logger.info("处理完成！")
+        return True
+
+    # 处理查询
+    results = classifier.process_queries(
+        config['source_file'], 
+        config['query_col'], 
+        enhanced_prompt
+    )
+    if results is None:
+        logger.error(f"未保存结果: {config['save_path']}")
+        return False
+    
+    # 保存结果（空查询的行标记为 empty，而不是调用失败）
+    queries = load_queries(config['source_file'], config['query_col'])
+    if len(queries) != len(results):
+        logger.warning(f"查询列有 {len(queries)} 行，结果有 {len(results)} 行，不区分空查询")
+        queries = None
+    classifier.save_results(config['save_path'], results, queries=queries)
+    classifier.log_usage()
+    
+    logger.info("处理完成！")
+    return True
+
 def main():
     """主函数"""
+    parser = profiler.add_profile_args(argparse.ArgumentParser(description='使用DeepSeek对查询进行分类'))
+    cost_estimator.add_estimate_args(parser)
+    args = parser.parse_args()
+    profiler.enable_from_args(args, 'Query_sort_DS_enhance')
+
     # 配置参数
     config = {
         'source_file': "select_0729.xlsx",
@@ -162,37 +536,17 @@ def main():
     }
     
     try:
-        # 初始化分类器
-        classifier = QueryClassifier(config['token'], model=config['model'])
-        
-        # 读取系统prompt
-        system_prompt = classifier.read_system_prompt(config['prompt_file'])
-        
-        # 读取训练示例
-        training_examples = classifier.get_training_examples(
-            config['annotation_file'], 
-            config['query_col_annotation'], 
-            config['label_col_annotation']
-        )
-        
-        # 增强系统prompt
-        enhanced_prompt = classifier.create_enhanced_prompt(system_prompt, training_examples)
-        
-        # 处理查询
-        results = classifier.process_queries(
-            config['source_file'], 
-            config['query_col'], 
-            enhanced_prompt
-        )
-        
-        # 保存结果
-        classifier.save_results(config['save_path'], results)
-        
-        logger.info("处理完成！")
-        
+        if args.dry_run:
+            cost_estimator.estimate_from_args(args, [config['source_file']], 'enhance', config['prompt_file'],
+                                              config['annotation_file'], config['query_col'])
+            return
+        if not run(config):
+            sys.exit(1)
     except Exception as e:
         logger.error(f"程序执行失败: {e}")
         raise
+    finally:
+        profiler.finish()
 
 if __name__ == "__main__":
     main()
\ No newline at end of file
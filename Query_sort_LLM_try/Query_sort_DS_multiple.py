@@ -1,9 +1,13 @@
+import argparse
 import os
 import glob
 from openpyxl import Workbook
 import openpyxl
 from openpyxl.utils import get_column_letter
-from openai import OpenAI
+
+import cost_estimator
+import profiler
+from Query_sort_DS_enhance import log_validation, validate_labels
 
 def read_system_prompt(file_path):
     """从txt文件中读取系统prompt"""
@@ -23,17 +27,19 @@ def infer(system_prompt, user_query, token=None, model="deepseek-chat"):
         print("错误：缺少API token")
         return ""
     
+    from openai import OpenAI
     client = OpenAI(api_key=token, base_url="https://api.deepseek.com/v1")
     
     try:
-        response = client.chat.completions.create(
-            model=model,
-            messages=[
-                {"role": "system", "content": system_prompt},
-                {"role": "user", "content": user_query},
-            ],
-            stream=False
-        )
+        with profiler.stage('api_call'):
+            response = client.chat.completions.create(
+                model=model,
+                messages=[
+                    {"role": "system", "content": system_prompt},
+                    {"role": "user", "content": user_query},
+                ],
+                stream=False
+            )
         
         result = response.choices[0].message.content
         return result.strip()
@@ -50,7 +56,7 @@ def save_excel(save_path, title_list, content_list):
         ws.append(title_list)
         
         for content in content_list:
-            ws.append([content])
+            ws.append(list(content))
         
         # 确保目录存在
         os.makedirs(os.path.dirname(save_path), exist_ok=True)
@@ -59,7 +65,8 @@ def save_excel(save_path, title_list, content_list):
         if os.path.exists(save_path):
             os.remove(save_path)
             
-        wb.save(save_path)
+        with profiler.stage('save_excel'):
+            wb.save(save_path)
         wb.close()
     except Exception as e:
         print(f"保存Excel文件时出错: {e}")
@@ -69,7 +76,8 @@ def get_training_examples(annotation_file):
     examples = []
     
     try:
-        wb = openpyxl.load_workbook(annotation_file)
+        with profiler.stage('load_examples'):
+            wb = openpyxl.load_workbook(annotation_file)
         ws = wb.active
         
         for row in ws.iter_rows(min_row=2):  # 跳过标题行
@@ -91,6 +99,8 @@ def create_enhanced_prompt(base_prompt, examples):
     if not examples:
         return base_prompt
     
+    # 去重并按 (标签, query) 排序，标注文件行序变化时prompt前缀保持稳定，利于服务端前缀缓存
+    examples = sorted(set(examples), key=lambda example: (example[1], example[0]))
     example_section = "\n\n已标注示例（格式：'query' -> label）：\n"
     for query, label in examples:
         example_section += f'"{query}" -> {label}\n'
@@ -102,7 +112,8 @@ def process_single_file(input_file, enhanced_prompt, token, model):
     results = []
     
     try:
-        wb = openpyxl.load_workbook(input_file)
+        with profiler.stage('load_source'):
+            wb = openpyxl.load_workbook(input_file)
         ws = wb.active
         
         for row in ws.iter_rows(min_row=2):  # 从第二行开始
@@ -117,6 +128,7 @@ def process_single_file(input_file, enhanced_prompt, token, model):
             if query:
                 response = infer(enhanced_prompt, query, token, model)
                 results.append(response)
+                profiler.mark('first_row')
                 print(f"处理: {query[:50]}... -> {response}")
         
         wb.close()
@@ -160,13 +172,20 @@ def main(source_files, annotation_file, prompt_file, token, model, output_dir):
         base_name = os.path.basename(input_file)
         output_path = os.path.join(output_dir, f"classified_{base_name}")
         
-        # 保存结果
-        save_excel(output_path, ["模型判断结果"], results)
+        # 校验回复并保存结果：标签为1~5，状态为 ok / invalid / failed
+        labels, statuses = validate_labels(results)
+        log_validation(statuses, f"{base_name} 校验结果")
+        save_excel(output_path, ["模型判断结果", "标签", "状态"], zip(results, labels, statuses))
         print(f"结果已保存到: {output_path}")
     
     print("\n所有文件处理完成！")
 
 if __name__ == "__main__":
+    parser = profiler.add_profile_args(argparse.ArgumentParser(description='批量对目录下的Excel文件进行分类'))
+    cost_estimator.add_estimate_args(parser)
+    args = parser.parse_args()
+    profiler.enable_from_args(args, 'Query_sort_DS_multiple')
+
     # 配置参数
     INPUT_DIR = "input_files"  # 输入文件目录
     ANNOTATION_FILE = "labeled_data.xlsx"  # 标注文件路径
@@ -178,12 +197,18 @@ if __name__ == "__main__":
     # 获取所有输入文件
     source_files = glob.glob(os.path.join(INPUT_DIR, "*.xlsx"))
     
-    # 运行主程序
-    main(
-        source_files=source_files,
-        annotation_file=ANNOTATION_FILE,
-        prompt_file=PROMPT_FILE,
-        token=API_TOKEN,
-        model=MODEL_NAME,
-        output_dir=OUTPUT_DIR
-    )
\ No newline at end of file
+    try:
+        if args.dry_run:
+            cost_estimator.estimate_from_args(args, source_files, 'multiple', PROMPT_FILE, ANNOTATION_FILE)
+        else:
+            # 运行主程序
+            main(
+                source_files=source_files,
+                annotation_file=ANNOTATION_FILE,
+                prompt_file=PROMPT_FILE,
+                token=API_TOKEN,
+                model=MODEL_NAME,
+                output_dir=OUTPUT_DIR
+            )
+    finally:
+        profiler.finish()
\ No newline at end of file
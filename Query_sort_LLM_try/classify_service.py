@@ -0,0 +1,293 @@
+"""
+常驻的分类HTTP服务，用于准实时审核
+
+    python cli.py serve --annotation label.xlsx --port 8000
+    curl -s localhost:8000/classify -d '{"queries": ["你为什么不听我的", "打得好"]}'
+
+- 微批：收到的查询先进入队列，凑够 max_batch 条或等待满 max_wait 秒后合并成一次带编号的请求，
+  批量回复中缺失/无效的条目再用严格prompt逐条补问
+- 缓存：有效标签按查询文本存入内存LRU缓存，重复的查询不再请求；同一查询正在请求中时复用同一个结果
+- 延迟上限：每个请求最多等待 timeout 秒，超时返回 504；排队的查询超过 max_pending 时直接返回 503
+- 后端：共用一个 QueryClassifier（其中的OpenAI客户端自带连接池），最多 workers 个批次同时请求
+
+接口：
+    POST /classify   {"query": "..."} 或 {"queries": [...]}
+                     -> {"results": [{"query", "label", "status", "cached"}, ...]}
+    GET  /stats      请求数、缓存命中、批次数、平均批大小、API调用和token用量
+    GET  /health
+"""
+import json
+import logging
+import queue
+import signal
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import Future, ThreadPoolExecutor
+from concurrent.futures import TimeoutError as FutureTimeout
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from Query_sort_DS_enhance import STRICT_INSTRUCTION, parse_numbered_labels, validate_label
+
+logger = logging.getLogger(__name__)
+
+# 批量请求时追加到系统prompt末尾的说明
+BATCH_INSTRUCTION = (
+    "\n\n下面会给出若干条需要判断的玩家发言（每条带编号）。"
+    "请按上面的规则分别判断每条发言，每条一行，格式为'编号: 数字'，不要输出其他内容。"
+)
+
+
+def build_batch_query(queries):
+    """组装批量请求：每条查询一行，带编号"""
+    return "\n".join(f"{i}. {' '.join(query.split())}" for i, query in enumerate(queries, 1))
+
+
+class LRUCache:
+    """线程安全的LRU缓存"""
+
+    def __init__(self, maxsize=100000):
+        self.maxsize = maxsize
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            if key not in self._data:
+                return None
+            self._data.move_to_end(key)
+            return self._data[key]
+
+    def put(self, key, value):
+        if self.maxsize <= 0:
+            return
+        with self._lock:
+            self._data[key] = value
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+
+    def __len__(self):
+        return len(self._data)
+
+
+class MicroBatcher:
+    """把并发到达的查询按数量和时间窗口合并成批次，交给分类器"""
+
+    def __init__(self, classifier, enhanced_prompt, max_batch=16, max_wait=0.05, workers=4,
+                 cache_size=100000, max_pending=10000):
+        self.classifier = classifier
+        self.enhanced_prompt = enhanced_prompt
+        self.batch_prompt = enhanced_prompt + BATCH_INSTRUCTION
+        self.strict_prompt = enhanced_prompt + STRICT_INSTRUCTION
+        self.max_batch = max(1, max_batch)
+        self.max_wait = max_wait
+        self.cache = LRUCache(cache_size)
+        self.stats = {'queries': 0, 'cache_hits': 0, 'coalesced': 0, 'rejected': 0,
+                      'batches': 0, 'batched_queries': 0}
+        self._queue = queue.Queue(maxsize=max_pending)
+        self._inflight = {}          # 查询 -> Future，同一查询只请求一次
+        self._lock = threading.Lock()
+        self._pool = ThreadPoolExecutor(max_workers=max(1, workers), thread_name_prefix='batch')
+        # 所有worker都忙时不再凑批，查询留在队列里，等有空闲worker时一次取满一批
+        self._slots = threading.Semaphore(max(1, workers))
+        self._closed = threading.Event()
+        self._collector = threading.Thread(target=self._collect, name='collector', daemon=True)
+        self._collector.start()
+
+    def submit(self, query):
+        """提交一条查询，返回结果为 (标签, 状态, 是否命中缓存) 的Future；队列已满时抛出 queue.Full"""
+        query = query.strip()
+        future = Future()
+        with self._lock:
+            self.stats['queries'] += 1
+            if not query:
+                future.set_result(("", "empty", False))
+                return future
+            cached = self.cache.get(query)
+            if cached is not None:
+                self.stats['cache_hits'] += 1
+                future.set_result((cached, "ok", True))
+                return future
+            if query in self._inflight:
+                self.stats['coalesced'] += 1
+                return self._inflight[query]
+            try:
+                self._queue.put_nowait(query)
+            except queue.Full:
+                self.stats['rejected'] += 1
+                raise
+            self._inflight[query] = future
+        return future
+
+    def _collect(self):
+        """收集线程：凑满一批或等待超时后把批次交给线程池"""
+        while not self._closed.is_set():
+            if not self._slots.acquire(timeout=0.1):
+                continue
+            try:
+                first = self._queue.get(timeout=0.1)
+            except queue.Empty:
+                self._slots.release()
+                continue
+            batch = [first]
+            deadline = time.monotonic() + self.max_wait
+            while len(batch) < self.max_batch:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                try:
+                    batch.append(self._queue.get(timeout=remaining))
+                except queue.Empty:
+                    break
+            with self._lock:
+                self.stats['batches'] += 1
+                self.stats['batched_queries'] += len(batch)
+            self._pool.submit(self._run_batch, batch)
+
+    def _classify(self, batch):
+        """对一批查询分类，返回 [(标签, 状态), ...]"""
+        if len(batch) == 1:
+            response = self.classifier.infer(self.enhanced_prompt, batch[0])
+            results = [validate_label(response)]
+        else:
+            response = self.classifier.infer(self.batch_prompt, build_batch_query(batch))
+            results = [validate_label(label) for label in parse_numbered_labels(response, len(batch))]
+        # 缺失或无效的条目用严格prompt逐条补问
+        for i, (label, status) in enumerate(results):
+            if status != "ok":
+                results[i] = validate_label(self.classifier.infer(self.strict_prompt, batch[i]))
+        return results
+
+    def _run_batch(self, batch):
+        try:
+            results = self._classify(batch)
+        except Exception as e:
+            logger.error(f"批次分类失败: {e}")
+            results = [("", "failed")] * len(batch)
+        finally:
+            self._slots.release()
+        for query, (label, status) in zip(batch, results):
+            if status == "ok":
+                self.cache.put(query, label)
+            with self._lock:
+                future = self._inflight.pop(query)
+            future.set_result((label, status, False))
+
+    def snapshot(self):
+        """当前的统计信息"""
+        with self._lock:
+            stats = dict(self.stats)
+        stats['pending'] = self._queue.qsize()
+        stats['cache_size'] = len(self.cache)
+        stats['avg_batch_size'] = stats['batched_queries'] / stats['batches'] if stats['batches'] else 0.0
+        stats['api_calls'] = self.classifier.api_calls
+        stats['usage'] = dict(self.classifier.usage)
+        return stats
+
+    def close(self):
+        self._closed.set()
+        self._collector.join()
+        self._pool.shutdown(wait=True)
+
+
+class ClassifyHandler(BaseHTTPRequestHandler):
+    """HTTP接口，server 上挂有 batcher 和 timeout"""
+
+    protocol_version = 'HTTP/1.1'
+
+    def _send_json(self, code, payload):
+        body = json.dumps(payload, ensure_ascii=False).encode('utf-8')
+        self.send_response(code)
+        self.send_header('Content-Type', 'application/json; charset=utf-8')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_GET(self):
+        if self.path == '/health':
+            self._send_json(200, {'status': 'ok'})
+        elif self.path == '/stats':
+            self._send_json(200, self.server.batcher.snapshot())
+        else:
+            self._send_json(404, {'error': 'not found'})
+
+    def do_POST(self):
+        if self.path != '/classify':
+            self._send_json(404, {'error': 'not found'})
+            return
+        try:
+            length = int(self.headers.get('Content-Length') or 0)
+            payload = json.loads(self.rfile.read(length) or b'{}')
+            queries = payload['queries'] if 'queries' in payload else [payload['query']]
+            # 字符串本身也可迭代，必须显式检查，否则 {"queries": "abc"} 会被逐字分类
+            if not isinstance(queries, list) or not all(isinstance(query, str) for query in queries):
+                raise TypeError('queries 必须是字符串列表，query 必须是字符串')
+        except (ValueError, KeyError, TypeError) as e:
+            self._send_json(400, {'error': f'请求格式错误: {e}'})
+            return
+
+        try:
+            futures = [self.server.batcher.submit(query) for query in queries]
+        except queue.Full:
+            self._send_json(503, {'error': '排队的查询过多，请稍后重试'})
+            return
+
+        deadline = time.monotonic() + self.server.timeout_seconds
+        results = []
+        try:
+            for query, future in zip(queries, futures):
+                label, status, cached = future.result(timeout=max(0.0, deadline - time.monotonic()))
+                results.append({'query': query, 'label': label, 'status': status, 'cached': cached})
+        except FutureTimeout:
+            self._send_json(504, {'error': f'分类超时（{self.server.timeout_seconds}s）'})
+            return
+        self._send_json(200, {'results': results})
+
+    def log_message(self, format, *args):
+        logger.debug("%s - %s", self.address_string(), format % args)
+
+
+def make_server(batcher, host='127.0.0.1', port=8000, timeout=10.0):
+    """创建HTTP服务（未启动）"""
+    server = ThreadingHTTPServer((host, port), ClassifyHandler)
+    server.daemon_threads = True
+    server.batcher = batcher
+    server.timeout_seconds = timeout
+    return server
+
+
+def serve(config):
+    """
+    按配置启动服务，直到收到 Ctrl+C
+    config 在 Query_sort_DS_enhance.build_classifier 的配置之外还支持：
+    host, port, max_batch, max_wait, workers, cache_size, max_pending, timeout
+    """
+    from Query_sort_DS_enhance import build_classifier
+
+    classifier, enhanced_prompt = build_classifier(config)
+    batcher = MicroBatcher(classifier, enhanced_prompt,
+                           max_batch=config.get('max_batch', 16),
+                           max_wait=config.get('max_wait', 0.05),
+                           workers=config.get('workers', 4),
+                           cache_size=config.get('cache_size', 100000),
+                           max_pending=config.get('max_pending', 10000))
+    server = make_server(batcher, config.get('host', '127.0.0.1'), config.get('port', 8000),
+                         config.get('timeout', 10.0))
+    # 收到 SIGTERM 时与 Ctrl+C 一样正常退出，输出统计信息
+    def _terminate(signum, frame):
+        raise KeyboardInterrupt
+    signal.signal(signal.SIGTERM, _terminate)
+
+    host, port = server.server_address[:2]
+    logger.info(f"分类服务已启动: http://{host}:{port} (批大小 {batcher.max_batch}, "
+                f"等待窗口 {batcher.max_wait * 1000:.0f}ms, 并发批次 {config.get('workers', 4)})")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+        batcher.close()
+        logger.info(f"服务已停止: {json.dumps(batcher.snapshot(), ensure_ascii=False)}")
+        classifier.log_usage()
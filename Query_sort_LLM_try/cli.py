@@ -0,0 +1,397 @@
+"""
+统一命令行入口
+
+    python cli.py extract  --settle settle.parquet --trace trace.parquet --date 20250729 0729.csv
+    python cli.py ingest   0729.csv 0729_process.xlsx
+    python cli.py select   0729_process.xlsx 0729_select.xlsx
+    python cli.py classify 0729_select.xlsx 0729_results.xlsx --annotation label.xlsx
+    python cli.py classify 0729_select.xlsx 0729_results.xlsx --repair   # 只重跑无效/失败的行
+    python cli.py report   0729_results.xlsx --source 0729_select.xlsx -o 0729_report.xlsx
+    python cli.py estimate input_files/ --script multiple --concurrency 4 --rpm 600
+    python cli.py serve    --annotation label.xlsx --port 8000
+    python cli.py phrases  0717_negative_analysis.xlsx 0717_语义归类词组.xlsx --column B
+    python cli.py sentences 0729_results.xlsx 0729_语义归类句子.xlsx --column D --label-column 标签 --labels 1 2
+    python cli.py txt2xlsx 'logs/*.txt' --output-dir converted --format parquet
+    python cli.py export   0729_select.parquet 0729_select.xlsx
+
+ingest/select/classify 的输入输出可以是 .parquet/.arrow（带类型的列式格式，推荐作为中间文件）或 .xlsx。
+
+每个子命令只在执行时导入自己需要的模块，--help 和参数解析不会加载 pandas/openai/jieba 等重量级依赖。
+"""
+import argparse
+import logging
+import os
+import sys
+
+import cost_estimator
+import profiler
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+
+
+def cmd_extract(args):
+    from local_query import run_local_query
+    run_local_query(args.settle, args.trace, args.output, args.date, args.uid_bucket[0], args.uid_bucket[1],
+                    args.msg_type, args.limit, args.threads)
+    profiler.mark('first_row')
+    return True
+
+
+def cmd_ingest(args):
+    from original_process import process_csv_to_excel
+    return process_csv_to_excel(args.input, args.output, args.seen_index)
+
+
+def cmd_select(args):
+    from Query_Select import process_excel
+    process_excel(args.input, args.output)
+    return True
+
+
+def cmd_classify(args):
+    if args.dry_run:
+        cost_estimator.estimate_from_args(args, [args.input], 'enhance', args.prompt, args.annotation,
+                                          args.query_col)
+        return True
+    from Query_sort_DS_enhance import run
+    return run({
+        'source_file': args.input,
+        'annotation_file': args.annotation,
+        'prompt_file': args.prompt,
+        'token': args.token,
+        'model': args.model,
+        'save_path': args.output,
+        'query_col': args.query_col,
+        'query_col_annotation': args.annotation_query_col,
+        'label_col_annotation': args.annotation_label_col,
+        'stub': args.stub,
+        'session_mode': args.by_session,
+        'session_window': args.session_window,
+        'session_max_lines': args.session_max_lines,
+        'repair': args.repair,
+        'repair_workers': args.repair_workers,
+    })
+
+
+def cmd_report(args):
+    from label_store import LabelStore, write_report
+    store = LabelStore.open(args.input, args.source)
+    profiler.mark('first_row')
+    if args.store:
+        store.save(args.store)
+        print(f"标签存储已保存到 {args.store}（{len(store)} 行）")
+    tables = store.report(args.labels, args.top_n, args.min_lines, args.bin_seconds)
+    print(tables['标签分布'].to_string(index=False))
+    print(tables['高频玩家'].head(10).to_string(index=False))
+    if args.output:
+        write_report(tables, args.output)
+        print(f"报表已保存到 {args.output}")
+    return True
+
+
+def cmd_estimate(args):
+    cost_estimator.estimate_from_args(args, args.inputs, args.script, args.prompt, args.annotation,
+                                      args.query_col)
+    return True
+
+
+def cmd_serve(args):
+    from classify_service import serve
+    serve({
+        'annotation_file': args.annotation,
+        'prompt_file': args.prompt,
+        'token': args.token,
+        'model': args.model,
+        'query_col_annotation': args.annotation_query_col,
+        'label_col_annotation': args.annotation_label_col,
+        'stub': args.stub,
+        'stub_latency': args.stub_latency,
+        'host': args.host,
+        'port': args.port,
+        'max_batch': args.max_batch,
+        'max_wait': args.max_wait_ms / 1000,
+        'workers': args.workers,
+        'cache_size': args.cache_size,
+        'max_pending': args.max_pending,
+        'timeout': args.timeout,
+    })
+    return True
+
+
+def cmd_phrases(args):
+    import jieba_word_select
+    if args.jieba_cache:
+        jieba_word_select.init_jieba(args.jieba_cache)
+    jieba_word_select.extract_and_cluster_phrases(
+        input_file=args.input,
+        output_file=args.output,
+        sheet_name=args.sheet,
+        text_column=args.column,
+        top_n=args.top_n,
+        min_count=args.min_count,
+    )
+    return True
+
+
+def cmd_sentences(args):
+    import jieba_word_select
+    jieba_word_select.cluster_sentences_report(
+        input_file=args.input,
+        output_file=args.output,
+        sheet_name=args.sheet,
+        text_column=args.column,
+        label_column=args.label_column,
+        labels=args.labels,
+        threshold=args.threshold,
+        top_n=args.top_n,
+        min_size=args.min_size,
+        examples=args.examples,
+        tables=args.tables,
+        window=args.window,
+        workers=args.workers,
+    )
+    return True
+
+
+def cmd_txt2xlsx(args):
+    sys.path.insert(0, os.path.join(HERE, 'txt-to-excel', 'src'))
+    import main as txt_to_excel
+    txt_to_excel.run(args)
+    profiler.mark('first_row')
+    return True
+
+
+def cmd_export(args):
+    from table_io import format_durations, read_table, write_table
+    df = read_table(args.input, columns=args.columns or None)
+    profiler.mark('first_row')
+    write_table(format_durations(df), args.output)
+    print(f"已导出 {len(df)} 行到 {args.output}")
+    return True
+
+
+def cmd_shard_split(args):
+    import shard_queue
+    params = {}
+    if args.task == 'classify':
+        params = {
+            'prompt_file': os.path.abspath(args.prompt),
+            'annotation_file': os.path.abspath(args.annotation),
+            'query_col': args.query_col,
+            'model': args.model,
+        }
+    shard_queue.split(args.input, args.queue, args.task, args.output_dir, args.shard_rows, params)
+    return True
+
+
+def cmd_shard_work(args):
+    import shard_queue
+    shard_queue.run_workers(args.queue, args.processes, args.lease_seconds, args.max_attempts)
+    return True
+
+
+def cmd_shard_status(args):
+    import shard_queue
+    queue = shard_queue.ShardQueue(args.queue)
+    try:
+        print(' '.join(f"{k}={v}" for k, v in queue.status().items()))
+    finally:
+        queue.close()
+    return True
+
+
+def cmd_shard_merge(args):
+    import shard_queue
+    shard_queue.merge(args.queue, args.output)
+    return True
+
+
+def build_parser():
+    parser = argparse.ArgumentParser(description='王者荣耀玩家语音query处理工具')
+    sub = parser.add_subparsers(dest='command', required=True)
+
+    p = sub.add_parser('extract', help='在本地导出文件上执行get_query.sql的关联（DuckDB）')
+    p.add_argument('output', help='输出文件（.csv/.parquet），可直接作为ingest的输入')
+    p.add_argument('--settle', required=True, help='smoba_dsl_5v5pvpsettle 导出文件（csv/parquet，支持通配符）')
+    p.add_argument('--trace', required=True, help='smoba_ai_dsl_chat_commander_trace 导出文件（csv/parquet，支持通配符）')
+    p.add_argument('--date', required=True, help='起始日期 tdbank_imp_date，如 20250720')
+    p.add_argument('--uid-bucket', type=int, nargs=2, default=[80, 99], metavar=('LOW', 'HIGH'),
+                   help='uid倒数第5、4位的分桶范围')
+    p.add_argument('--msg-type', default='2', help='mission.msg_type 过滤值')
+    p.add_argument('--limit', type=int, help='与线上SQL一样在每一步截断（默认不截断）')
+    p.add_argument('--threads', type=int, help='DuckDB线程数（默认CPU核数）')
+    p.set_defaults(func=cmd_extract)
+
+    p = sub.add_parser('ingest', help='原始CSV -> 处理后的Excel（original_process）')
+    p.add_argument('input', help='输入CSV/Parquet文件')
+    p.add_argument('output', help='输出Excel文件')
+    p.add_argument('--seen-index', help='增量模式：已处理行索引文件（SQLite），只输出之前没处理过的行')
+    p.set_defaults(func=cmd_ingest)
+
+    p = sub.add_parser('select', help='筛选指令后出现的玩家发言（Query_Select）')
+    p.add_argument('input', help='ingest输出的Excel文件')
+    p.add_argument('output', help='输出Excel文件')
+    p.set_defaults(func=cmd_select)
+
+    p = sub.add_parser('classify', help='调用大模型对查询分类（Query_sort_DS_enhance）')
+    p.add_argument('input', help='待分类的Excel文件')
+    p.add_argument('output', help='分类结果Excel文件')
+    p.add_argument('--annotation', default='label.xlsx', help='标注示例文件')
+    p.add_argument('--prompt', default=os.path.join(HERE, 'system_prompt.txt'), help='系统prompt文件')
+    p.add_argument('--token', default=os.environ.get('DEEPSEEK_API_KEY', ''),
+                   help='API密钥（默认读取环境变量 DEEPSEEK_API_KEY）')
+    p.add_argument('--model', default='deepseek-chat')
+    p.add_argument('--query-col', default='D', help='查询所在列（select 输出的发言在D列）')
+    p.add_argument('--annotation-query-col', default='C', help='标注文件中查询列')
+    p.add_argument('--annotation-label-col', default='D', help='标注文件中标签列')
+    p.add_argument('--stub', action='store_true', help='使用本地模拟后端（离线调试，模拟前缀缓存）')
+    p.add_argument('--by-session', action='store_true',
+                   help='按对局分组分类：输入为ingest的输出，每局一次请求并附带指令时间线')
+    p.add_argument('--session-window', type=int, default=60, help='发言前多少秒内的指令算作上下文')
+    p.add_argument('--session-max-lines', type=int, default=30, help='每次请求最多包含的发言条数')
+    p.add_argument('--repair', action='store_true',
+                   help='修复已有结果：只对output中无效/失败的行用更严格的prompt重新请求，并原地更新')
+    p.add_argument('--repair-workers', type=int, default=4, help='修复时的并发请求数')
+    cost_estimator.add_estimate_args(p)
+    p.set_defaults(func=cmd_classify)
+
+    p = sub.add_parser('report', help='分类结果的分组统计：按日期/deskid/玩家/英雄的比例、高频玩家、对局时间分布')
+    p.add_argument('input', help='分类结果文件（带A-D列，或配合 --source），或 --store 保存的标签存储')
+    p.add_argument('--source', help='结果文件只有回复列时，按行对应的源文件（select的输出）')
+    p.add_argument('-o', '--output', help='报表Excel文件')
+    p.add_argument('--store', help='把标签存储保存为 .parquet/.arrow，之后可直接作为输入')
+    p.add_argument('--labels', type=int, nargs='+', default=[1], help='统计的标签（默认1：消极且明确表达人机不听指挥）')
+    p.add_argument('--top-n', type=int, default=20, help='高频玩家/对局的数量')
+    p.add_argument('--min-lines', type=int, default=5, help='玩家/英雄至少有多少条发言才参与统计')
+    p.add_argument('--bin-seconds', type=int, default=60, help='对局时间分布的分段长度（秒）')
+    p.set_defaults(func=cmd_report)
+
+    p = sub.add_parser('estimate', help='预估分类任务的API调用次数、token、费用和耗时（不调用API）')
+    p.add_argument('inputs', nargs='+', help='输入文件或目录（目录下的xlsx/parquet/arrow），支持通配符')
+    p.add_argument('--script', choices=['enhance', 'multiple'], default='enhance',
+                   help='按哪个分类脚本的prompt和调用方式预估')
+    p.add_argument('--annotation', default='label.xlsx', help='标注示例文件')
+    p.add_argument('--prompt', default=os.path.join(HERE, 'system_prompt.txt'), help='系统prompt文件')
+    p.add_argument('--query-col', help='查询所在列（默认D）')
+    cost_estimator.add_estimate_args(p, dry_run=False)
+    p.set_defaults(func=cmd_estimate)
+
+    p = sub.add_parser('serve', help='常驻HTTP分类服务（微批 + LRU缓存），配合 load_test.py 压测')
+    p.add_argument('--host', default='127.0.0.1')
+    p.add_argument('--port', type=int, default=8000)
+    p.add_argument('--annotation', default='label.xlsx', help='标注示例文件')
+    p.add_argument('--prompt', default=os.path.join(HERE, 'system_prompt.txt'), help='系统prompt文件')
+    p.add_argument('--token', default=os.environ.get('DEEPSEEK_API_KEY', ''),
+                   help='API密钥（默认读取环境变量 DEEPSEEK_API_KEY）')
+    p.add_argument('--model', default='deepseek-chat')
+    p.add_argument('--annotation-query-col', default='C', help='标注文件中查询列')
+    p.add_argument('--annotation-label-col', default='D', help='标注文件中标签列')
+    p.add_argument('--stub', action='store_true', help='使用本地模拟后端')
+    p.add_argument('--stub-latency', type=float, default=0.0, help='模拟后端每次调用的延迟（秒）')
+    p.add_argument('--max-batch', type=int, default=16, help='每批最多合并的查询数')
+    p.add_argument('--max-wait-ms', type=float, default=50, help='凑批的最长等待时间（毫秒）')
+    p.add_argument('--workers', type=int, default=4, help='同时请求的批次数')
+    p.add_argument('--cache-size', type=int, default=100000, help='LRU缓存的查询条数')
+    p.add_argument('--max-pending', type=int, default=10000, help='排队查询上限，超过时返回503')
+    p.add_argument('--timeout', type=float, default=10.0, help='单个HTTP请求的最长等待（秒），超时返回504')
+    p.set_defaults(func=cmd_serve)
+
+    p = sub.add_parser('phrases', help='提取并归类动名词词组（jieba_word_select）')
+    p.add_argument('input', help='输入Excel文件')
+    p.add_argument('output', help='输出Excel文件')
+    p.add_argument('--sheet', default='Sheet1', help='工作表名')
+    p.add_argument('--column', default='B', help='包含对话文本的列名')
+    p.add_argument('--top-n', type=int, default=10, help='输出前N类词组')
+    p.add_argument('--min-count', type=int, default=3, help='词组最低出现次数')
+    p.add_argument('--jieba-cache', default=None,
+                   help='jieba词典缓存文件（默认 ~/.cache/query_sort/jieba.cache 或环境变量 JIEBA_CACHE）')
+    p.set_defaults(func=cmd_phrases)
+
+    p = sub.add_parser('sentences', help='按字符n-gram TF-IDF相似度把整句归类（SimHash近似近邻 + 并查集）')
+    p.add_argument('input', help='输入文件（xlsx/parquet/arrow）')
+    p.add_argument('output', help='输出Excel文件')
+    p.add_argument('--sheet', default='Sheet1', help='工作表名（Excel）')
+    p.add_argument('--column', default='D', help='包含句子的列名')
+    p.add_argument('--label-column', default=None, help='标签列名，指定时只归类 --labels 中的标签')
+    p.add_argument('--labels', type=int, nargs='+', default=[1, 2], help='保留的标签')
+    p.add_argument('--threshold', type=float, default=0.5, help='余弦相似度阈值')
+    p.add_argument('--top-n', type=int, default=200, help='输出前N类')
+    p.add_argument('--min-size', type=int, default=2, help='每类最少出现次数')
+    p.add_argument('--examples', type=int, default=5, help='每类输出的示例句子数')
+    p.add_argument('--tables', type=int, default=16, help='SimHash位置换的次数（越多召回越高、越慢）')
+    p.add_argument('--window', type=int, default=8, help='排序后与相邻多少个句子比较')
+    p.add_argument('--workers', type=int, default=None, help='计算特征的进程数（默认CPU核数）')
+    p.set_defaults(func=cmd_sentences)
+
+    p = sub.add_parser('txt2xlsx', help='"text -> label" 文本流式转换为xlsx/csv/parquet（txt-to-excel）')
+    p.add_argument('inputs', nargs='+', help='输入txt文件（支持通配符）')
+    output = p.add_mutually_exclusive_group(required=True)
+    output.add_argument('-o', '--output', help='单个输入时的输出文件（.xlsx/.csv/.parquet）')
+    output.add_argument('--output-dir', help='输出目录，每个输入对应一个输出文件')
+    p.add_argument('--format', default='xlsx', choices=['xlsx', 'csv', 'parquet'], help='--output-dir 时的输出格式')
+    p.add_argument('--workers', type=int, default=None, help='并行进程数（默认CPU核数）')
+    p.add_argument('--chunk-size', type=int, default=100000, help='每批写出的行数')
+    p.set_defaults(func=cmd_txt2xlsx)
+
+    p = sub.add_parser('export', help='把中间文件（parquet/arrow/csv）导出为Excel报表')
+    p.add_argument('input', help='输入文件')
+    p.add_argument('output', help='输出文件（.xlsx/.csv）')
+    p.add_argument('--columns', nargs='+', help='只导出这些列')
+    p.set_defaults(func=cmd_export)
+
+    shard = sub.add_parser('shard', help='分片到多进程/多机执行（SQLite租约队列）')
+    shard_sub = shard.add_subparsers(dest='shard_command', required=True)
+
+    p = shard_sub.add_parser('split', help='切分输入文件并登记分片')
+    p.add_argument('input', help='输入文件（csv/xlsx/parquet）')
+    p.add_argument('--queue', required=True, help='队列文件（SQLite）')
+    p.add_argument('--task', choices=['ingest', 'classify'], required=True)
+    p.add_argument('--output-dir', required=True, help='分片结果目录（多机时需在共享文件系统上）')
+    p.add_argument('--shard-rows', type=int, default=1000, help='每个分片的行数')
+    p.add_argument('--annotation', default='label.xlsx', help='classify: 标注示例文件')
+    p.add_argument('--prompt', default=os.path.join(HERE, 'system_prompt.txt'), help='classify: 系统prompt文件')
+    p.add_argument('--query-col', default='D', help='classify: 查询所在列名')
+    p.add_argument('--model', default='deepseek-chat')
+    p.set_defaults(func=cmd_shard_split)
+
+    p = shard_sub.add_parser('work', help='领取并处理分片（API密钥读取环境变量 DEEPSEEK_API_KEY）')
+    p.add_argument('--queue', required=True, help='队列文件（SQLite）')
+    p.add_argument('--processes', type=int, default=1, help='本机启动的worker进程数')
+    p.add_argument('--lease-seconds', type=int, default=300, help='租约时长，超时未续约的分片会被重新领取')
+    p.add_argument('--max-attempts', type=int, default=3, help='每个分片最多尝试次数')
+    p.set_defaults(func=cmd_shard_work)
+
+    p = shard_sub.add_parser('status', help='查看分片进度')
+    p.add_argument('--queue', required=True, help='队列文件（SQLite）')
+    p.set_defaults(func=cmd_shard_status)
+
+    p = shard_sub.add_parser('merge', help='按源文件顺序合并分片结果')
+    p.add_argument('--queue', required=True, help='队列文件（SQLite）')
+    p.add_argument('output', help='输出文件（csv/xlsx/parquet）')
+    p.set_defaults(func=cmd_shard_merge)
+
+    leaf_parsers = [p for name, p in sub.choices.items() if name != 'shard']
+    leaf_parsers += list(shard_sub.choices.values())
+    for p in leaf_parsers:
+        profiler.add_profile_args(p)
+    return parser
+
+
+def main(argv=None):
+    args = build_parser().parse_args(argv)
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+    run_name = '_'.join(filter(None, ['cli', args.command, getattr(args, 'shard_command', None)]))
+    profiler.enable_from_args(args, run_name)
+    try:
+        ok = args.func(args)
+    finally:
+        profiler.finish()
+
+    first_row = profiler.get_mark('first_row')
+    if first_row is not None:
+        print(f"首行耗时: {first_row:.3f}s")
+    return 0 if ok is not False else 1
+
+
+if __name__ == '__main__':
+    sys.exit(main())
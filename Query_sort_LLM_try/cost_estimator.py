@@ -0,0 +1,235 @@
+"""
+分类任务的预估（dry-run）：不调用API，只流式读取输入，估算调用次数、token用量、费用和耗时
+
+    python cli.py estimate input_files/ --script multiple --concurrency 4 --rpm 600
+    python cli.py classify 0729_select.xlsx out.xlsx --dry-run
+    python Query_sort_DS_enhance.py --dry-run
+
+- 查询：逐行流式读取（Excel直接解析工作表XML，列式格式只读查询列），多个文件用多进程并行读取；
+  统计非空查询数和去重后的查询数，重复出现的查询就是结果缓存（如 cli.py serve）可以命中的部分
+- token：按对应脚本的方式组装增强prompt，用 stub_backend.count_tokens 在本地估算；
+  系统prompt按64 token一块计入服务端前缀缓存，第一次调用之后按缓存命中计费
+- 耗时：每次调用耗时 = 平均延迟 + 脚本自带的间隔，再受并发数、RPM、TPM限制；
+  平均延迟可以用 --latency 指定，或从 --profile 生成的报告中读取 api_call 阶段的平均耗时
+"""
+import glob
+import hashlib
+import json
+import os
+from concurrent.futures import ProcessPoolExecutor
+
+from stub_backend import CACHE_BLOCK_TOKENS, count_tokens
+from table_io import COLUMNAR_EXTS, EXCEL_EXTS, iter_excel_column
+
+# 各脚本的默认查询列和每次调用后的固定间隔（秒）
+SCRIPTS = {
+    'enhance': {'query_col': 'D', 'sleep': 0.5},
+    'multiple': {'query_col': 'D', 'sleep': 0.0},
+}
+
+# 每百万token的价格（元），默认按 deepseek-chat 的公开价格，价格调整时用参数覆盖
+DEFAULT_PRICES = {'input_hit': 0.2, 'input_miss': 2.0, 'output': 3.0}
+
+
+def expand_sources(paths):
+    """展开目录和通配符：目录下取所有xlsx和列式文件"""
+    files = []
+    for path in paths:
+        if os.path.isdir(path):
+            for ext in EXCEL_EXTS + COLUMNAR_EXTS:
+                files.extend(sorted(glob.glob(os.path.join(path, f'*{ext}'))))
+        else:
+            files.extend(sorted(glob.glob(path)) or [path])
+    return files
+
+
+def iter_queries(path, query_col):
+    """逐行产出查询列的值（不含标题行）；Excel按列字母，其他格式按列名"""
+    ext = os.path.splitext(path)[1].lower()
+    if ext == '.parquet':
+        import pyarrow.parquet as pq
+        for batch in pq.ParquetFile(path).iter_batches(columns=[query_col]):
+            yield from batch.column(0).to_pylist()
+    elif ext in ('.arrow', '.feather'):
+        import pyarrow.feather as feather
+        yield from feather.read_table(path, columns=[query_col], memory_map=True).column(0).to_pylist()
+    elif ext in EXCEL_EXTS:
+        yield from iter_excel_column(path, query_col)
+    else:
+        import pandas as pd
+        for chunk in pd.read_csv(path, usecols=[query_col], chunksize=200000, dtype=str):
+            yield from chunk[query_col]
+
+
+def scan_file(path, query_col):
+    """
+    统计一个文件：行数、非空查询数、查询token总数，以及去重后的 {查询哈希: token数}
+    哈希用blake2b而不是内置hash，保证多进程之间一致
+    """
+    rows = queries = query_tokens = 0
+    distinct = {}
+    for value in iter_queries(path, query_col):
+        rows += 1
+        query = "" if value is None or value != value else str(value).strip()
+        if not query:
+            continue
+        queries += 1
+        key = hashlib.blake2b(query.encode('utf-8'), digest_size=8).digest()
+        tokens = distinct.get(key)
+        if tokens is None:
+            tokens = distinct[key] = count_tokens(query)
+        query_tokens += tokens
+    return {'file': path, 'rows': rows, 'queries': queries, 'query_tokens': query_tokens, 'distinct': distinct}
+
+
+def build_prompt(script, prompt_file, annotation_file):
+    """按脚本自身的方式组装增强prompt"""
+    if script == 'multiple':
+        import Query_sort_DS_multiple as multiple
+        return multiple.create_enhanced_prompt(multiple.read_system_prompt(prompt_file),
+                                               multiple.get_training_examples(annotation_file))
+    from Query_sort_DS_enhance import QueryClassifier
+    from stub_backend import StubClient
+    classifier = QueryClassifier('', client=StubClient())
+    return classifier.create_enhanced_prompt(classifier.read_system_prompt(prompt_file),
+                                             classifier.get_training_examples(annotation_file))
+
+
+def latency_from_profile(report_path):
+    """从 --profile 报告中读取 api_call 阶段的平均耗时（秒）"""
+    with open(report_path, 'r', encoding='utf-8') as f:
+        stage = json.load(f)['stages'].get('api_call')
+    if not stage or not stage['calls']:
+        raise ValueError(f"{report_path} 中没有 api_call 阶段，请使用分类脚本的 --profile 报告")
+    return stage['total_s'] / stage['calls']
+
+
+def plan(calls, query_tokens, system_tokens, completion_tokens=1, concurrency=1, latency=1.0,
+         sleep=0.0, rpm=0, tpm=0, prices=None):
+    """估算给定调用次数下的token用量、费用和耗时"""
+    prices = dict(DEFAULT_PRICES, **(prices or {}))
+    prompt_tokens = calls * system_tokens + query_tokens
+    # 第一次调用之后，系统prompt中完整的64 token块都能命中前缀缓存
+    cached_prefix = system_tokens // CACHE_BLOCK_TOKENS * CACHE_BLOCK_TOKENS
+    hit = max(0, calls - 1) * cached_prefix
+    miss = prompt_tokens - hit
+    completion = calls * completion_tokens
+    cost = (hit * prices['input_hit'] + miss * prices['input_miss'] + completion * prices['output']) / 1e6
+
+    limits = {'concurrency': concurrency / max(latency + sleep, 1e-9)}
+    if rpm:
+        limits['rpm'] = rpm / 60
+    if tpm and calls:
+        limits['tpm'] = tpm / 60 / ((prompt_tokens + completion) / calls)
+    bottleneck = min(limits, key=limits.get)
+    seconds = calls / limits[bottleneck] if calls else 0.0
+    return {
+        'calls': calls,
+        'prompt_tokens': prompt_tokens,
+        'prompt_cache_hit_tokens': hit,
+        'prompt_cache_miss_tokens': miss,
+        'completion_tokens': completion,
+        'cost': cost,
+        'calls_per_second': limits[bottleneck],
+        'bottleneck': bottleneck,
+        'seconds': seconds,
+    }
+
+
+def estimate(sources, script='enhance', prompt_file='system_prompt.txt', annotation_file='label.xlsx',
+             query_col=None, concurrency=1, latency=1.0, sleep=None, rpm=0, tpm=0, completion_tokens=1,
+             prices=None, workers=None):
+    """
+    预估在 sources 上运行分类脚本的开销，返回报告dict
+    as_run: 按脚本现状每条非空查询调用一次；dedup: 相同查询只调用一次（结果缓存命中其余的）
+    """
+    defaults = SCRIPTS[script]
+    query_col = query_col or defaults['query_col']
+    sleep = defaults['sleep'] if sleep is None else sleep
+    files = expand_sources(sources)
+
+    if len(files) > 1 and workers != 1:
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            scans = list(pool.map(scan_file, files, [query_col] * len(files)))
+    else:
+        scans = [scan_file(path, query_col) for path in files]
+
+    distinct = {}
+    for scan in scans:
+        distinct.update(scan.pop('distinct'))
+    queries = sum(scan['queries'] for scan in scans)
+    query_tokens = sum(scan['query_tokens'] for scan in scans)
+
+    system_tokens = count_tokens(build_prompt(script, prompt_file, annotation_file))
+    options = dict(completion_tokens=completion_tokens, concurrency=concurrency, latency=latency,
+                   sleep=sleep, rpm=rpm, tpm=tpm, prices=prices)
+    return {
+        'script': script,
+        'files': scans,
+        'rows': sum(scan['rows'] for scan in scans),
+        'queries': queries,
+        'distinct_queries': len(distinct),
+        'result_cache_hits': queries - len(distinct),
+        'system_prompt_tokens': system_tokens,
+        'settings': dict(options, query_col=query_col, prices=dict(DEFAULT_PRICES, **(prices or {}))),
+        'as_run': plan(queries, query_tokens, system_tokens, **options),
+        'dedup': plan(len(distinct), sum(distinct.values()), system_tokens, **options),
+    }
+
+
+def format_duration(seconds):
+    hours, rest = divmod(int(round(seconds)), 3600)
+    return f"{hours}小时{rest // 60}分{rest % 60}秒" if hours else f"{rest // 60}分{rest % 60}秒"
+
+
+def print_report(report):
+    settings = report['settings']
+    print(f"脚本: {report['script']}，{len(report['files'])} 个文件，{report['rows']} 行，"
+          f"非空查询 {report['queries']}，去重后 {report['distinct_queries']}"
+          f"（重复 {report['result_cache_hits']}）")
+    print(f"系统prompt约 {report['system_prompt_tokens']} tokens；并发 {settings['concurrency']}，"
+          f"平均延迟 {settings['latency']:.2f}s + 间隔 {settings['sleep']:.2f}s，"
+          f"RPM {settings['rpm'] or '不限'}，TPM {settings['tpm'] or '不限'}")
+    for name, title in (('as_run', '按脚本现状'), ('dedup', '相同查询只请求一次')):
+        p = report[name]
+        rate = p['prompt_cache_hit_tokens'] / p['prompt_tokens'] if p['prompt_tokens'] else 0.0
+        print(f"[{title}] API调用 {p['calls']} 次，prompt {p['prompt_tokens']} tokens"
+              f"（前缀缓存命中 {p['prompt_cache_hit_tokens']}，命中率 {rate:.1%}），"
+              f"completion {p['completion_tokens']} tokens，费用约 {p['cost']:.2f} 元，"
+              f"耗时约 {format_duration(p['seconds'])}（瓶颈: {p['bottleneck']}）")
+
+
+def add_estimate_args(parser, dry_run=True):
+    """给命令行加上预估参数；dry_run=False 时不加 --dry-run 开关（estimate 子命令本身就是预估）"""
+    if dry_run:
+        parser.add_argument('--dry-run', action='store_true', help='只预估调用次数、token、费用和耗时，不调用API')
+    parser.add_argument('--concurrency', type=int, default=1, help='预估: 同时进行的请求数')
+    parser.add_argument('--latency', type=float, default=1.0, help='预估: 单次调用平均延迟（秒）')
+    parser.add_argument('--latency-from', metavar='PROFILE_JSON',
+                        help='预估: 从 --profile 报告读取 api_call 的平均耗时作为延迟')
+    parser.add_argument('--rpm', type=int, default=0, help='预估: 每分钟请求数上限（0为不限）')
+    parser.add_argument('--tpm', type=int, default=0, help='预估: 每分钟token数上限（0为不限）')
+    parser.add_argument('--completion-tokens', type=int, default=1, help='预估: 每次回复的token数')
+    parser.add_argument('--price-input-hit', type=float, default=DEFAULT_PRICES['input_hit'],
+                        help='预估: 缓存命中的输入价格（元/百万token）')
+    parser.add_argument('--price-input-miss', type=float, default=DEFAULT_PRICES['input_miss'],
+                        help='预估: 缓存未命中的输入价格（元/百万token）')
+    parser.add_argument('--price-output', type=float, default=DEFAULT_PRICES['output'],
+                        help='预估: 输出价格（元/百万token）')
+    parser.add_argument('--estimate-json', help='预估: 把报告写为JSON')
+    return parser
+
+
+def estimate_from_args(args, sources, script, prompt_file, annotation_file, query_col=None):
+    """按 add_estimate_args 的参数执行预估并输出报告"""
+    latency = latency_from_profile(args.latency_from) if args.latency_from else args.latency
+    report = estimate(sources, script, prompt_file, annotation_file, query_col,
+                      concurrency=args.concurrency, latency=latency, rpm=args.rpm, tpm=args.tpm,
+                      completion_tokens=args.completion_tokens,
+                      prices={'input_hit': args.price_input_hit, 'input_miss': args.price_input_miss,
+                              'output': args.price_output})
+    print_report(report)
+    if args.estimate_json:
+        with open(args.estimate_json, 'w', encoding='utf-8') as f:
+            json.dump(report, f, ensure_ascii=False, indent=2)
+    return report
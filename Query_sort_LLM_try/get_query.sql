@@ -1,5 +1,5 @@
 select
-    '20250720' as tdbank_imp_date,
+    t2.imp_date as tdbank_imp_date,  -- 该局结算所在分区的日期，多天导出时按天区分
     t3.relayentity as relayentity,
     t3.deskid as deskid,
     t3.deskseq as deskseq,
@@ -9,7 +9,8 @@ select
 from
 (
     select
-        relaysvrentity, gameseq, gamesvrentity, acntcamp, vopenid
+        relaysvrentity, gameseq, gamesvrentity, acntcamp, vopenid,
+        substr(tdbank_imp_date, 1, 8) as imp_date
     from ieg_tdbank::smoba_dsl_5v5pvpsettle_fht0
     where 
         substr(tdbank_imp_date, 1, 8) >= '20250720' and 
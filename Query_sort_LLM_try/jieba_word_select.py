@@ -1,12 +1,30 @@
+import argparse
+import logging
+import os
+import zlib
 import pandas as pd
 from collections import defaultdict
 import jieba
 import jieba.posseg as pseg
 from openpyxl import Workbook
-from gensim.models import Word2Vec
-from sklearn.cluster import KMeans
 import numpy as np
-from itertools import groupby
+
+import profiler
+from table_io import is_columnar, read_table
+
+# 持久化的jieba前缀词典缓存，避免每次启动都重新构建（默认缓存在系统临时目录，可能被清理）
+DEFAULT_JIEBA_CACHE = os.environ.get(
+    'JIEBA_CACHE', os.path.join(os.path.expanduser('~'), '.cache', 'query_sort', 'jieba.cache'))
+
+def init_jieba(cache_file=DEFAULT_JIEBA_CACHE):
+    """使用持久化缓存初始化jieba词典，首次运行时构建缓存，之后直接加载"""
+    if jieba.dt.initialized:
+        return
+    os.makedirs(os.path.dirname(cache_file) or '.', exist_ok=True)
+    jieba.setLogLevel(logging.WARNING)
+    jieba.dt.cache_file = cache_file
+    with profiler.stage('jieba_init'):
+        jieba.initialize()
 
 def extract_and_cluster_phrases(input_file, output_file, sheet_name='Sheet1', text_column='对话', 
                               top_n=50, min_count=5, similarity_threshold=0.6):
@@ -22,9 +40,19 @@ def extract_and_cluster_phrases(input_file, output_file, sheet_name='Sheet1', te
         min_count: 词组最低出现次数(过滤低频词组)
         similarity_threshold: 语义相似度阈值(0-1)
     """
+    # 训练词向量和聚类依赖较重，仅在需要时导入
+    from gensim.models import Word2Vec
+    from sklearn.cluster import KMeans
+
     try:
+        init_jieba()
+
         # 1. 读取Excel文件
-        df = pd.read_excel(input_file, sheet_name=sheet_name)
+        with profiler.stage('read_input'):
+            if is_columnar(input_file):
+                df = read_table(input_file, columns=[text_column])
+            else:
+                df = pd.read_excel(input_file, sheet_name=sheet_name)
         
         if text_column not in df.columns:
             raise ValueError(f"列 '{text_column}' 不存在于Excel文件中")
@@ -33,27 +61,29 @@ def extract_and_cluster_phrases(input_file, output_file, sheet_name='Sheet1', te
         phrase_counter = defaultdict(int)
         all_sentences = []  # 用于训练词向量
         
-        for text in df[text_column]:
-            if pd.isna(text):
-                continue
+        with profiler.stage('pos_tag'):
+            for text in df[text_column]:
+                if pd.isna(text):
+                    continue
                 
-            text = str(text)
-            all_sentences.append([word.word for word in pseg.cut(text)])
+                text = str(text)
+                all_sentences.append([word.word for word in pseg.cut(text)])
+                profiler.mark('first_row')
             
-            words = list(pseg.cut(text))
-            for i in range(len(words)-1):
-                # 提取动词+名词组合
-                if words[i].flag.startswith('v') and words[i+1].flag.startswith('n'):
-                    phrase = f"{words[i].word}{words[i+1].word}"
-                    phrase_counter[phrase] += 1
-                
-                # 提取动词+名词+名词组合
-                if i < len(words)-2:
-                    if (words[i].flag.startswith('v') and 
-                        words[i+1].flag.startswith('n') and 
-                        words[i+2].flag.startswith('n')):
-                        phrase = f"{words[i].word}{words[i+1].word}{words[i+2].word}"
+                words = list(pseg.cut(text))
+                for i in range(len(words)-1):
+                    # 提取动词+名词组合
+                    if words[i].flag.startswith('v') and words[i+1].flag.startswith('n'):
+                        phrase = f"{words[i].word}{words[i+1].word}"
                         phrase_counter[phrase] += 1
+                
+                    # 提取动词+名词+名词组合
+                    if i < len(words)-2:
+                        if (words[i].flag.startswith('v') and 
+                            words[i+1].flag.startswith('n') and 
+                            words[i+2].flag.startswith('n')):
+                            phrase = f"{words[i].word}{words[i+1].word}{words[i+2].word}"
+                            phrase_counter[phrase] += 1
         
         # 3. 过滤低频词组
         phrases = [phrase for phrase, count in phrase_counter.items() if count >= min_count]
@@ -62,7 +92,8 @@ def extract_and_cluster_phrases(input_file, output_file, sheet_name='Sheet1', te
         
         # 4. 训练词向量模型(简单版)
         # 更准确的做法是使用预训练的中文词向量模型
-        model = Word2Vec(sentences=all_sentences, vector_size=100, window=5, min_count=1, workers=4)
+        with profiler.stage('word2vec'):
+            model = Word2Vec(sentences=all_sentences, vector_size=100, window=5, min_count=1, workers=4)
         
         # 5. 获取词向量(对词组中的词向量取平均)
         phrase_vectors = []
@@ -87,7 +118,8 @@ def extract_and_cluster_phrases(input_file, output_file, sheet_name='Sheet1', te
         # 6. 聚类相似的词组
         # 使用KMeans聚类，聚类数量自动确定为词组数量的1/4
         n_clusters = max(2, len(valid_phrases) // 4)
-        kmeans = KMeans(n_clusters=n_clusters, random_state=42).fit(phrase_vectors)
+        with profiler.stage('kmeans'):
+            kmeans = KMeans(n_clusters=n_clusters, random_state=42).fit(phrase_vectors)
         
         # 7. 组织聚类结果
         clustered_phrases = defaultdict(list)
@@ -133,15 +165,310 @@ def extract_and_cluster_phrases(input_file, output_file, sheet_name='Sheet1', te
             adjusted_width = (max_length + 2) * 1.2
             ws.column_dimensions[column_letter].width = adjusted_width
         
-        wb.save(output_file)
+        with profiler.stage('write_excel'):
+            wb.save(output_file)
         print(f"成功提取并归类动名词词组，保存到: {output_file}")
         print(f"共找到 {len(cluster_results)} 类词组，输出前 {top_n} 类")
         
     except Exception as e:
         print(f"处理过程中发生错误: {str(e)}")
 
+# ---------- 句子级语义归类 ----------
+
+SIMHASH_BITS = 64
+# 召回检查：在出现次数最多的这么多个不同句子之间两两计算精确相似度
+RECALL_CHECK_TOP = 300
+
+
+_NON_WORD = r'[\W_]+'
+
+
+def _normalize_sentences(sentences):
+    """
+    去掉空白和标点后合并相同的句子，返回 (规范化文本, 展示用的原句, 次数)
+    展示用的原句取该规范化文本下出现最多的写法
+    """
+    raw = pd.Series(sentences, dtype=object)
+    frame = pd.DataFrame({'key': raw.str.replace(_NON_WORD, '', regex=True), 'sentence': raw})
+    forms = frame.groupby(['key', 'sentence'], sort=False).size().rename('count').reset_index()
+    forms = forms.sort_values('count', ascending=False, kind='stable')
+    grouped = forms.groupby('key', sort=False)
+    merged = pd.DataFrame({'sentence': grouped['sentence'].first(), 'count': grouped['count'].sum()})
+    return merged.index.tolist(), merged['sentence'].tolist(), merged['count'].to_numpy()
+
+
+def _featurize_chunk(texts, n_features, ngram_range=(1, 3)):
+    """
+    把一批（已规范化的）句子转换为哈希后的字符n-gram词频（稀疏行），返回 (每行特征数, 特征编号, 词频)
+    哈希用crc32，保证多进程之间一致
+    """
+    lengths, indices, counts = [], [], []
+    mask = n_features - 1
+    low, high = ngram_range
+    for text in texts:
+        grams = defaultdict(int)
+        for n in range(low, high + 1):
+            for i in range(len(text) - n + 1):
+                grams[zlib.crc32(text[i:i + n].encode('utf-8')) & mask] += 1
+        lengths.append(len(grams))
+        indices.extend(grams.keys())
+        counts.extend(grams.values())
+    return (np.asarray(lengths, dtype=np.int64), np.asarray(indices, dtype=np.int32),
+            np.asarray(counts, dtype=np.float32))
+
+
+def _popcount64(values):
+    """uint64数组每个元素中1的个数"""
+    if hasattr(np, 'bitwise_count'):
+        return np.bitwise_count(values).astype(np.int64)
+    return np.unpackbits(values.view(np.uint8).reshape(-1, 8), axis=1).sum(axis=1)
+
+
+def _pack_bits(bits):
+    """每行64个bool打包成一个uint64"""
+    return np.ascontiguousarray(np.packbits(bits, axis=1)).view('>u8').ravel().astype(np.uint64)
+
+
+def _row_ranges(indptr, rows):
+    """rows中每一行在稀疏数组里的下标（拼接在一起），以及每个下标属于第几个输入"""
+    starts = indptr[rows]
+    lengths = indptr[rows + 1] - starts
+    owner = np.repeat(np.arange(len(rows)), lengths)
+    offsets = np.arange(lengths.sum()) - np.repeat(np.cumsum(lengths) - lengths, lengths)
+    return starts[owner] + offsets, owner
+
+
+def _pair_cosine(indptr, keys, data, left, right, n_features):
+    """
+    成对计算两行（已L2归一化）稀疏向量的余弦相似度
+    keys 为全局有序的 行号*n_features+特征编号；用特征较少的一行的每个特征到另一行中二分查找
+    """
+    swap = (indptr[left + 1] - indptr[left]) > (indptr[right + 1] - indptr[right])
+    left, right = np.where(swap, right, left), np.where(swap, left, right)
+    pos, owner = _row_ranges(indptr, left)
+    probe = right[owner].astype(np.int64) * n_features + keys[pos] % n_features
+    found = np.minimum(np.searchsorted(keys, probe), len(keys) - 1)
+    hit = keys[found] == probe
+    return np.bincount(owner[hit], weights=data[pos[hit]] * data[found[hit]], minlength=len(left))
+
+
+def _similar_pairs(indptr, keys, data, left, right, n_features, threshold, batch=200000):
+    """分块校验候选对，返回余弦相似度 >= threshold 的 (left, right)"""
+    edges_l, edges_r = [], []
+    for start in range(0, len(left), batch):
+        l, r = left[start:start + batch], right[start:start + batch]
+        similar = _pair_cosine(indptr, keys, data, l, r, n_features) >= threshold
+        edges_l.append(l[similar])
+        edges_r.append(r[similar])
+    if not edges_l:
+        return np.zeros(0, dtype=np.int64), np.zeros(0, dtype=np.int64)
+    return np.concatenate(edges_l), np.concatenate(edges_r)
+
+
+def _union_find(n, left, right):
+    """对相似句子对做并查集合并，返回每个节点的根（根为该组中编号最小的节点）"""
+    parent = np.arange(n)
+    while len(left):
+        root_l, root_r = parent[left], parent[right]
+        differ = root_l != root_r
+        if not differ.any():
+            break
+        left, right = left[differ], right[differ]
+        root_l, root_r = root_l[differ], root_r[differ]
+        low = np.minimum(root_l, root_r)
+        np.minimum.at(parent, root_l, low)
+        np.minimum.at(parent, root_r, low)
+        # 路径压缩：反复跳到父节点的父节点，直到所有节点直接指向根
+        while True:
+            grand = parent[parent]
+            if np.array_equal(grand, parent):
+                break
+            parent = grand
+    return parent
+
+
+def read_sentences(input_file, sheet_name='Sheet1', text_column='D', label_column=None, labels=(1, 2)):
+    """读取待归类的句子；指定 label_column 时只保留标签在 labels 中的行"""
+    columns = [text_column] + ([label_column] if label_column else [])
+    if is_columnar(input_file):
+        df = read_table(input_file, columns=columns)
+    else:
+        df = pd.read_excel(input_file, sheet_name=sheet_name)
+    for col in columns:
+        if col not in df.columns:
+            raise ValueError(f"列 '{col}' 不存在于文件 {input_file} 中")
+    if label_column:
+        df = df[pd.to_numeric(df[label_column], errors='coerce').isin(labels)]
+    texts = df[text_column].dropna().astype(str).str.strip()
+    return texts[texts != ''].tolist()
+
+
+def cluster_sentences(sentences, threshold=0.5, n_features=2 ** 16, tables=16, window=8,
+                      workers=None, chunk_size=20000, seed=42):
+    """
+    把语义相近（字符n-gram的TF-IDF余弦相似度 >= threshold）的句子归为一类
+
+    1. 去掉空白和标点后相同的句子先合并计数，只对不同的句子计算
+    2. 每个句子表示为哈希后的字符1~3-gram TF-IDF向量（多进程分块计算）
+    3. 用随机超平面把向量压缩为64位SimHash作为近似近邻索引：SimHash完全相同的句子先与该组的代表句子校验，
+       通过的只由代表参与后面的扫描；对SimHash做 tables 次随机的位置换并排序，
+       每个句子只和排序后相邻的 window 个句子比较，候选对先用汉明距离过滤，再计算精确的余弦相似度
+    4. 相似的句子对用并查集合并为类
+    5. 召回检查：出现次数最多的 RECALL_CHECK_TOP 个句子两两计算精确相似度，统计相似却没有归为一类的对数
+    内存与不同句子的数量成正比，候选对按块校验
+
+    返回DataFrame：sentence, count, cluster（同类句子的cluster相同）
+    """
+    keys, display, counts = _normalize_sentences(sentences)
+    n = len(keys)
+    if n == 0:
+        return pd.DataFrame(columns=['sentence', 'count', 'cluster'])
+
+    # 1. 特征：哈希字符n-gram词频，分块并行
+    chunks = [keys[i:i + chunk_size] for i in range(0, n, chunk_size)]
+    with profiler.stage('featurize'):
+        if len(chunks) > 1 and workers != 1:
+            from concurrent.futures import ProcessPoolExecutor
+            with ProcessPoolExecutor(max_workers=workers) as pool:
+                parts = list(pool.map(_featurize_chunk, chunks, [n_features] * len(chunks)))
+        else:
+            parts = [_featurize_chunk(chunk, n_features) for chunk in chunks]
+    lengths = np.concatenate([part[0] for part in parts])
+    indices = np.concatenate([part[1] for part in parts])
+    data = np.concatenate([part[2] for part in parts])
+    del parts
+    indptr = np.zeros(n + 1, dtype=np.int64)
+    np.cumsum(lengths, out=indptr[1:])
+
+    # 2. TF-IDF加权（词频取对数）并按行L2归一化
+    doc_freq = np.bincount(indices, minlength=n_features)
+    idf = (np.log((n + 1) / (doc_freq + 1)) + 1).astype(np.float32)
+    data = (1 + np.log(data)) * idf[indices]
+    rows = np.repeat(np.arange(n), lengths)
+    norms = np.sqrt(np.bincount(rows, weights=data * data, minlength=n))
+    data = (data / np.maximum(norms, 1e-12)[rows]).astype(np.float32)
+    # 全局有序的 行号*n_features+特征编号，用于校验时二分查找
+    keys = rows * np.int64(n_features) + indices
+    order = np.argsort(keys, kind='stable')
+    keys, indices, data = keys[order], indices[order], data[order]
+    del rows, order
+
+    # 3. SimHash：按块计算向量在64个随机超平面上的投影符号
+    rng = np.random.default_rng(seed)
+    planes = rng.standard_normal((n_features, SIMHASH_BITS)).astype(np.float32)
+    bits = np.zeros((n, SIMHASH_BITS), dtype=bool)
+    with profiler.stage('simhash'):
+        step = max(1, chunk_size // 4)
+        for start in range(0, n, step):
+            stop = min(n, start + step)
+            lo, hi = indptr[start], indptr[stop]
+            starts = indptr[start:stop] - lo
+            nonempty = lengths[start:stop] > 0
+            weighted = planes[indices[lo:hi]] * data[lo:hi, None]
+            if hi > lo:
+                projection = np.add.reduceat(weighted, starts[nonempty], axis=0)
+                bits[start:stop][nonempty] = projection > 0
+    del planes
+    signatures = _pack_bits(bits)
+
+    # 汉明距离的上限：期望距离 64*θ/π 再加2个标准差（漏掉的相似对极少，且多由并查集经其他句子补上）
+    p = np.arccos(np.clip(threshold, -1, 1)) / np.pi
+    max_hamming = int(np.ceil(SIMHASH_BITS * p + 2 * np.sqrt(SIMHASH_BITS * p * (1 - p))))
+
+    # 签名完全相同的句子在任何置换下都排在一起，大量近似重复句会占满窗口，使真正的近义句比较不到。
+    # 先把每组成员与代表（组内第一行）直接校验，通过的成员不再参与扫描，由代表替它们和其他句子比较
+    with profiler.stage('collapse_signatures'):
+        _, first, inverse = np.unique(signatures, return_index=True, return_inverse=True)
+        group_rep = first[inverse.ravel()]
+        members = np.flatnonzero(group_rep != np.arange(n))
+        collapsed_l, collapsed_r = _similar_pairs(indptr, keys, data, group_rep[members], members,
+                                                  n_features, threshold)
+        scan = np.setdiff1d(np.arange(n), collapsed_r, assume_unique=True)
+    scan_bits = bits[scan]
+
+    # 4. 候选对：每次随机置换SimHash的位后排序，与后面 window 个句子比较；
+    #    各次置换找到的候选对去重后再计算余弦相似度
+    pair_keys = []
+    with profiler.stage('ann_search'):
+        for _ in range(tables):
+            permuted = _pack_bits(scan_bits[:, rng.permutation(SIMHASH_BITS)])
+            order = scan[np.argsort(permuted, kind='stable')]
+            for offset in range(1, min(window, len(scan) - 1) + 1):
+                left, right = order[:-offset], order[offset:]
+                close = _popcount64(signatures[left] ^ signatures[right]) <= max_hamming
+                left, right = left[close], right[close]
+                pair_keys.append(np.minimum(left, right).astype(np.int64) * n + np.maximum(left, right))
+    del bits, scan_bits
+    pair_keys = np.unique(np.concatenate(pair_keys)) if pair_keys else np.zeros(0, dtype=np.int64)
+    candidates = len(pair_keys)
+
+    with profiler.stage('verify'):
+        left, right = _similar_pairs(indptr, keys, data, *np.divmod(pair_keys, n), n_features, threshold)
+    del pair_keys
+
+    with profiler.stage('union_find'):
+        left = np.concatenate([collapsed_l, left])
+        right = np.concatenate([collapsed_r, right])
+        roots = _union_find(n, left, right)
+    print(f"{len(sentences)} 句，去掉标点后不同的句子 {n} 个（签名相同而合并 {len(collapsed_r)} 个），"
+          f"校验候选对 {candidates} 个，相似对 {len(left)} 个")
+
+    # 5. 召回检查：高频句子之间相似却没有合并的对数
+    with profiler.stage('recall_check'):
+        top = np.sort(np.argsort(-counts, kind='stable')[:RECALL_CHECK_TOP])
+        top_l, top_r = np.triu_indices(len(top), k=1)
+        top_l, top_r = _similar_pairs(indptr, keys, data, top[top_l], top[top_r], n_features, threshold)
+        missed = int((roots[top_l] != roots[top_r]).sum())
+    if missed:
+        print(f"召回检查：出现最多的 {len(top)} 个句子中有 {missed}/{len(top_l)} 个相似对没有归为一类，"
+              f"可以调大 window 或 tables")
+    else:
+        print(f"召回检查：出现最多的 {len(top)} 个句子中的 {len(top_l)} 个相似对都已归为一类")
+
+    return pd.DataFrame({'sentence': display, 'count': counts, 'cluster': roots})
+
+
+def summarize_clusters(clustered, min_size=2, examples=5):
+    """每类的总次数、不同句子数、代表句子（出现最多，同次数取最短）和示例"""
+    clustered = clustered.assign(length=clustered['sentence'].str.len())
+    clustered = clustered.sort_values(['cluster', 'count', 'length'], ascending=[True, False, True])
+    grouped = clustered.groupby('cluster', sort=False)
+    summary = pd.DataFrame({
+        '出现次数': grouped['count'].sum(),
+        '不同句子数': grouped.size(),
+        '代表句子': grouped['sentence'].first(),
+        '示例': grouped['sentence'].agg(lambda s: " | ".join(s.iloc[1:examples + 1])),
+    })
+    summary = summary[summary['出现次数'] >= min_size]
+    return summary.sort_values(['出现次数', '不同句子数'], ascending=False).reset_index(drop=True)
+
+
+def cluster_sentences_report(input_file, output_file, sheet_name='Sheet1', text_column='D', label_column=None,
+                             labels=(1, 2), threshold=0.5, top_n=200, min_size=2, examples=5,
+                             tables=16, window=8, workers=None):
+    """读取句子、归类并把前 top_n 类写入Excel"""
+    with profiler.stage('read_input'):
+        sentences = read_sentences(input_file, sheet_name, text_column, label_column, labels)
+    profiler.mark('first_row')
+    clustered = cluster_sentences(sentences, threshold, tables=tables, window=window, workers=workers)
+    summary = summarize_clusters(clustered, min_size, examples)
+
+    wb = Workbook(write_only=True)
+    ws = wb.create_sheet("语义归类句子")
+    ws.append(["类编号", "出现次数", "不同句子数", "代表句子", "示例"])
+    for i, row in enumerate(summary.head(top_n).itertuples(index=False), 1):
+        ws.append([i, int(row[0]), int(row[1]), row[2], row[3]])
+    with profiler.stage('write_excel'):
+        wb.save(output_file)
+    print(f"共 {len(summary)} 类（至少出现 {min_size} 次），输出前 {min(top_n, len(summary))} 类到: {output_file}")
+    return summary
+
 # 使用示例
 if __name__ == "__main__":
+    parser = profiler.add_profile_args(argparse.ArgumentParser(description='提取并归类动名词词组'))
+    args = parser.parse_args()
+    profiler.enable_from_args(args, 'jieba_word_select')
+
     # 输入文件路径(修改为你的实际路径)
     input_excel = "0717_negative_analysis.xlsx"
     # 输出文件路径
@@ -156,4 +483,5 @@ if __name__ == "__main__":
         top_n=10,               # 提取前20类高频词组
         min_count=3,             # 词组最低出现次数
         similarity_threshold=0.6  # 语义相似度阈值
-    )
\ No newline at end of file
+    )
+    profiler.finish()
\ No newline at end of file
@@ -0,0 +1,206 @@
+"""
+分类结果的紧凑存储和统计报表
+
+    python cli.py report 0729_results.xlsx --source 0729_select.xlsx -o 0729_report.xlsx --store 0729_labels.parquet
+    python cli.py report 0729_labels.parquet -o 0729_report.xlsx --labels 1 2
+
+分类结果按行与 original_process 的键列对齐后保存为：
+    date / relay / deskid / deskseq   由A列（date_relay_deskid_deskseq）拆出，分类(category)列
+    openid                            分类列
+    hero                              源数据带英雄列时保留（分类列）
+    time_s                            对局内时间（秒，int32），来自帧号或B列
+    label                             标签编码（int8，1~5，0为无效/空）
+所有统计都在这些数组上做向量化的分组计算，几百万行也只需几秒。
+"""
+import os
+
+import numpy as np
+import pandas as pd
+
+from table_io import is_columnar, read_table
+
+LABEL_NAMES = {
+    0: '无效',
+    1: '消极且明确表达人机不听指挥',
+    2: '其他消极言论',
+    3: '中性指令',
+    4: '积极夸赞',
+    5: '日常闲聊',
+}
+
+GAME_COLUMNS = ['date', 'relay', 'deskid', 'deskseq']
+EXCEL_MAX_ROWS = 1048575  # 不含表头
+# 源数据中可能出现的英雄列名
+HERO_COLUMNS = ('hero', 'heroid', 'hero_id', '英雄')
+
+_GAME_KEY = r'^(?P<date>[^_]*)_(?P<relay>.*?)_(?P<deskid>.*)_(?P<deskseq>[^_]*)$'
+
+
+def split_game_key(keys):
+    """把A列（date_relay_deskid_deskseq）拆成四个分类列；只解析去重后的对局key，再按编码展开到每一行"""
+    codes, uniques = pd.factorize(keys, use_na_sentinel=False)
+    parts = pd.Series(uniques).astype(str).str.extract(_GAME_KEY).fillna('')
+    frame = pd.DataFrame(index=range(len(codes)))
+    for col in parts.columns:
+        part = pd.Categorical(parts[col])
+        frame[col] = pd.Categorical.from_codes(part.codes[codes], part.categories)
+    return frame
+
+
+def game_seconds(df):
+    """对局内时间（秒）：优先用整数帧号，其次是时长类型或 'M:SS' 字符串形式的B列"""
+    if 'frame' in df.columns:
+        return (df['frame'].astype('int64') * 66 // 1000).to_numpy(np.int32)
+    b = df['B']
+    if pd.api.types.is_timedelta64_dtype(b):
+        return b.dt.total_seconds().fillna(-1).to_numpy(np.int32)
+    parts = b.astype(str).str.split(':', expand=True).apply(pd.to_numeric, errors='coerce')
+    seconds = parts.iloc[:, -1].fillna(0)
+    for i in range(parts.shape[1] - 2, -1, -1):
+        seconds = seconds + parts.iloc[:, i].fillna(0) * 60 ** (parts.shape[1] - 1 - i)
+    return seconds.where(b.notna(), -1).to_numpy(np.int32)
+
+
+def label_codes(df):
+    """标签编码（int8），有"标签"列时直接使用，否则按"回复"列校验"""
+    if '标签' in df.columns:
+        labels = pd.to_numeric(df['标签'], errors='coerce')
+    else:
+        from Query_sort_DS_enhance import validate_labels
+        labels = pd.to_numeric(pd.Series(validate_labels(df['回复'])[0], index=df.index), errors='coerce')
+    labels = labels.where(labels.isin(range(1, 6)), 0)
+    return labels.fillna(0).to_numpy(np.int8)
+
+
+class LabelStore:
+    """按行对齐的键列 + int8 标签编码"""
+
+    def __init__(self, frame):
+        self.frame = frame
+
+    def __len__(self):
+        return len(self.frame)
+
+    @property
+    def has_hero(self):
+        return 'hero' in self.frame.columns
+
+    @classmethod
+    def from_results(cls, results_path, source_path=None):
+        """
+        从分类结果构建；结果文件不含A列时（classify 的普通输出只有回复列），按行与 source_path 对齐
+        """
+        results = read_table(results_path)
+        if 'A' not in results.columns:
+            if not source_path:
+                raise ValueError(f"{results_path} 中没有A列，请指定按行对应的源文件（--source）")
+            source = read_table(source_path)
+            if len(source) != len(results):
+                raise ValueError(f"结果文件有 {len(results)} 行，源文件有 {len(source)} 行，无法按行对应")
+            source = source.drop(columns=[c for c in results.columns if c in source.columns])
+            results = pd.concat([source.reset_index(drop=True), results.reset_index(drop=True)], axis=1)
+
+        frame = split_game_key(results['A'])
+        frame['openid'] = pd.Categorical(results['C'].astype(str))
+        hero = next((c for c in HERO_COLUMNS if c in results.columns), None)
+        if hero:
+            frame['hero'] = pd.Categorical(results[hero].astype(str))
+        frame['time_s'] = game_seconds(results)
+        frame['label'] = label_codes(results)
+        return cls(frame)
+
+    @classmethod
+    def load(cls, path):
+        return cls(read_table(path))
+
+    @classmethod
+    def open(cls, path, source_path=None):
+        """已保存的标签存储（列式文件且带label列）直接加载，否则从分类结果构建"""
+        if is_columnar(path):
+            store = cls.load(path)
+            if 'label' in store.frame.columns:
+                return store
+        return cls.from_results(path, source_path)
+
+    def save(self, path):
+        if os.path.dirname(path):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+        if path.lower().endswith('.parquet'):
+            self.frame.to_parquet(path, index=False)
+        else:
+            self.frame.to_feather(path)
+
+    def _hits(self, labels):
+        return np.isin(self.frame['label'].to_numpy(), np.asarray(labels, dtype=np.int8))
+
+    def label_counts(self):
+        """各标签的行数和占比"""
+        counts = np.bincount(self.frame['label'].to_numpy(), minlength=6)[:6]
+        total = counts.sum()
+        return pd.DataFrame({
+            'label': range(6),
+            'name': [LABEL_NAMES[i] for i in range(6)],
+            'lines': counts,
+            'share': counts / total if total else counts * 0.0,
+        })
+
+    def rates(self, by, labels=(1,), min_lines=1):
+        """按 by 分组统计行数、命中标签的行数和比例"""
+        by = [by] if isinstance(by, str) else list(by)
+        hits = pd.Series(self._hits(labels), index=self.frame.index)
+        grouped = hits.groupby([self.frame[col] for col in by], observed=True)
+        result = pd.DataFrame({'lines': grouped.size(), 'hits': grouped.sum()})
+        result['rate'] = result['hits'] / result['lines']
+        result = result[result['lines'] >= min_lines]
+        return result.reset_index().sort_values(by)
+
+    def top_offenders(self, by='openid', labels=(1,), n=20, min_lines=1):
+        """命中次数最多的前n个（次数相同按比例排序）"""
+        result = self.rates(by, labels, min_lines)
+        result = result[result['hits'] > 0]
+        return result.sort_values(['hits', 'rate'], ascending=False).head(n)
+
+    def time_distribution(self, labels=(1,), bin_seconds=60):
+        """按对局内时间分段统计：每段的行数、命中行数、比例"""
+        time_s = self.frame['time_s'].to_numpy()
+        valid = time_s >= 0
+        bins = time_s[valid] // bin_seconds
+        size = int(bins.max()) + 1 if len(bins) else 0
+        lines = np.bincount(bins, minlength=size)
+        hits = np.bincount(bins, weights=self._hits(labels)[valid], minlength=size).astype(np.int64)
+        start = np.arange(size) * bin_seconds
+        return pd.DataFrame({
+            'from': [f"{s // 60}:{s % 60:02d}" for s in start],
+            'to': [f"{(s + bin_seconds) // 60}:{(s + bin_seconds) % 60:02d}" for s in start],
+            'lines': lines,
+            'hits': hits,
+            'rate': np.divide(hits, lines, out=np.zeros(size), where=lines > 0),
+        })
+
+    def report(self, labels=(1,), top_n=20, min_lines=5, bin_seconds=60):
+        """生成报表的各个表，返回 {表名: DataFrame}"""
+        tables = {
+            '标签分布': self.label_counts(),
+            '按日期': self.rates('date', labels),
+            '按deskid': self.rates('deskid', labels),
+            '按玩家': self.rates('openid', labels, min_lines).sort_values(['hits', 'rate'], ascending=False),
+            '高频玩家': self.top_offenders('openid', labels, top_n, min_lines),
+            '高频对局': self.top_offenders(GAME_COLUMNS, labels, top_n),
+            '对局时间分布': self.time_distribution(labels, bin_seconds),
+        }
+        if self.has_hero:
+            tables['按英雄'] = self.rates('hero', labels)
+            tables['高频英雄'] = self.top_offenders('hero', labels, top_n, min_lines)
+        return tables
+
+
+def write_report(tables, output_path):
+    """把报表写为一个多sheet的Excel文件，超过Excel行数上限的表只保留前面的行"""
+    if os.path.dirname(output_path):
+        os.makedirs(os.path.dirname(output_path), exist_ok=True)
+    with pd.ExcelWriter(output_path) as writer:
+        for name, table in tables.items():
+            if len(table) > EXCEL_MAX_ROWS:
+                print(f"{name} 共 {len(table)} 行，只写出前 {EXCEL_MAX_ROWS} 行")
+                table = table.head(EXCEL_MAX_ROWS)
+            table.to_excel(writer, sheet_name=name, index=False)
@@ -0,0 +1,136 @@
+"""
+分类服务的压测脚本：按逐级提高的请求速率发送查询，报告吞吐量和延迟分位数
+
+    python cli.py serve --stub --stub-latency 0.3 &
+    python load_test.py --rates 20 50 100 200 --duration 10 --queries 0729_select.xlsx --column D
+
+按固定间隔（开环）发送请求，延迟从计划发送时刻算起，服务端排队造成的等待也计入延迟。
+--repeat 控制从已发送过的查询中重复抽样的比例，用于观察缓存命中的效果。
+"""
+import argparse
+import json
+import random
+import threading
+import time
+import urllib.error
+import urllib.request
+from concurrent.futures import ThreadPoolExecutor
+
+SAMPLE_QUERIES = [
+    "你为什么不听我的", "我说了集合你没听见吗", "让你推塔你偏要打野", "带不动一群菜鸟",
+    "打得好", "666", "去拿龙", "跟我走", "哈哈哈", "这队友没救了", "你们开心就好", "别送了",
+]
+
+
+def load_queries(path, column):
+    """从Excel/列式文件中读取查询（Excel按列字母，列式格式按列名）"""
+    from Query_sort_DS_enhance import load_queries as load_query_column
+    return [query for query in load_query_column(path, column) if query]
+
+
+def percentile(values, q):
+    if not values:
+        return 0.0
+    values = sorted(values)
+    return values[min(len(values) - 1, int(q * len(values)))]
+
+
+def post_query(url, query, timeout):
+    """发送一条查询，返回 (HTTP状态码, 是否命中缓存)"""
+    data = json.dumps({'query': query}, ensure_ascii=False).encode('utf-8')
+    request = urllib.request.Request(url, data=data, headers={'Content-Type': 'application/json'})
+    try:
+        with urllib.request.urlopen(request, timeout=timeout) as response:
+            result = json.loads(response.read())['results'][0]
+            return response.status, result['cached']
+    except urllib.error.HTTPError as e:
+        return e.code, False
+    except OSError:
+        return 0, False
+
+
+def run_rate(url, queries, rate, duration, repeat, timeout, max_threads):
+    """以固定速率发送 duration 秒，返回该速率下的统计"""
+    total = max(1, int(rate * duration))
+    latencies = []
+    codes = {}
+    cached = 0
+    lock = threading.Lock()
+    sent = []
+
+    def one(query, scheduled):
+        nonlocal cached
+        code, hit = post_query(url, query, timeout)
+        latency = time.perf_counter() - scheduled
+        with lock:
+            codes[code] = codes.get(code, 0) + 1
+            if code == 200:
+                latencies.append(latency)
+                cached += hit
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=max_threads) as pool:
+        for i in range(total):
+            if sent and random.random() < repeat:
+                query = random.choice(sent)
+            else:
+                # 新查询加上序号，保证只有 --repeat 抽中的查询会命中缓存
+                query = f"{random.choice(queries)} #{i}"
+                sent.append(query)
+            scheduled = start + i / rate
+            delay = scheduled - time.perf_counter()
+            if delay > 0:
+                time.sleep(delay)
+            pool.submit(one, query, scheduled)
+    elapsed = time.perf_counter() - start
+
+    ok = codes.get(200, 0)
+    return {
+        'rate': rate,
+        'sent': total,
+        'ok': ok,
+        'errors': total - ok,
+        'throughput': ok / elapsed if elapsed else 0.0,
+        'p50_ms': percentile(latencies, 0.50) * 1000,
+        'p99_ms': percentile(latencies, 0.99) * 1000,
+        'max_ms': max(latencies, default=0.0) * 1000,
+        'cache_hit': cached / ok if ok else 0.0,
+        'codes': codes,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description='分类服务压测')
+    parser.add_argument('--url', default='http://127.0.0.1:8000/classify')
+    parser.add_argument('--rates', type=float, nargs='+', default=[10, 20, 50, 100, 200],
+                        help='依次测试的请求速率（次/秒）')
+    parser.add_argument('--duration', type=float, default=10, help='每个速率持续的秒数')
+    parser.add_argument('--queries', help='查询来源文件（默认使用内置示例）')
+    parser.add_argument('--column', default='D', help='查询所在列')
+    parser.add_argument('--repeat', type=float, default=0.3, help='重复已发送查询的比例（0~1）')
+    parser.add_argument('--timeout', type=float, default=30, help='单个请求的客户端超时（秒）')
+    parser.add_argument('--max-threads', type=int, default=512, help='客户端最大并发连接数')
+    parser.add_argument('--output', help='把结果写为JSON')
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args()
+
+    random.seed(args.seed)
+    queries = load_queries(args.queries, args.column) if args.queries else SAMPLE_QUERIES
+
+    print(f"{'速率':>8} {'成功':>7} {'失败':>6} {'吞吐(次/秒)':>12} {'p50(ms)':>9} {'p99(ms)':>9} "
+          f"{'最大(ms)':>9} {'缓存命中':>8}")
+    reports = []
+    for rate in args.rates:
+        report = run_rate(args.url, queries, rate, args.duration, args.repeat, args.timeout, args.max_threads)
+        reports.append(report)
+        print(f"{report['rate']:>8.0f} {report['ok']:>7} {report['errors']:>6} {report['throughput']:>12.1f} "
+              f"{report['p50_ms']:>9.0f} {report['p99_ms']:>9.0f} {report['max_ms']:>9.0f} "
+              f"{report['cache_hit']:>8.1%}")
+
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            json.dump(reports, f, ensure_ascii=False, indent=2)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,109 @@
+"""
+get_query.sql 的本地版本：用DuckDB在本地CSV/Parquet导出文件上执行同样的 settle ⋈ chat_commander_trace 关联
+
+    python cli.py extract --settle 'settle/*.parquet' --trace 'trace/*.csv' --date 20250720 0720.csv
+
+与线上SQL保持一致的逻辑：
+    - settle表按 uid 倒数第5、4位（uid分桶）筛选，默认 80~99
+    - trace表只取 event_type='mission'、env='formal'、msg_type=2 的记录，从 mission JSON 中取出 chat_text
+    - 按 relay/gameseq/desk/openid 四个字段关联，去掉空发言
+    - tdbank_imp_date 取该局结算记录所在分区的日期（前8位），多天的导出可以按天统计，跨零点的对局也只有一个日期
+默认不加 limit，可以直接处理整天的数据；指定 limit 时与线上SQL一样在每一步都截断，便于对照。
+输出列与线上导出一致，可直接作为 original_process / cli.py ingest 的输入。
+"""
+import os
+
+QUERY = """
+SELECT
+    t2.imp_date AS tdbank_imp_date,
+    t3.relayentity AS relayentity,
+    t3.deskid AS deskid,
+    t3.deskseq AS deskseq,
+    t3.openid AS openid,
+    t3.chatcontents AS chatcontents,
+    t3.chattime
+FROM
+(
+    SELECT
+        relaysvrentity, gameseq, gamesvrentity, acntcamp, vopenid,
+        substr(CAST(tdbank_imp_date AS VARCHAR), 1, 8) AS imp_date
+    FROM {settle}
+    WHERE
+        substr(CAST(tdbank_imp_date AS VARCHAR), 1, 8) >= '{date}' AND
+        TRY_CAST(substr(CAST(uid AS VARCHAR), length(CAST(uid AS VARCHAR)) - 4, 2) AS INTEGER)
+            BETWEEN {uid_low} AND {uid_high}
+    {limit}
+) t2
+JOIN
+(
+    SELECT
+        relay_entity AS relayentity,
+        desk_seq AS deskseq,
+        desk_id AS deskid,
+        openid,
+        json_extract_string(json_extract_string(mission, '$.ori_chat_content'), '$.chat_text') AS chatcontents,
+        frame_no AS chattime
+    FROM {trace}
+    WHERE
+        substr(CAST(tdbank_imp_date AS VARCHAR), 1, 8) >= '{date}' AND
+        event_type = 'mission' AND
+        env = 'formal' AND
+        json_extract_string(mission, '$.msg_type') = '{msg_type}'
+    {limit}
+) t3
+ON CAST(t2.relaysvrentity AS VARCHAR) = CAST(t3.relayentity AS VARCHAR) AND
+   CAST(t2.gameseq AS VARCHAR) = CAST(t3.deskseq AS VARCHAR) AND
+   CAST(t2.gamesvrentity AS VARCHAR) = CAST(t3.deskid AS VARCHAR) AND
+   CAST(t2.vopenid AS VARCHAR) = CAST(t3.openid AS VARCHAR)
+WHERE t3.chatcontents IS NOT NULL AND t3.chatcontents <> ''
+{order}
+{limit}
+"""
+
+
+def _quote(value):
+    return "'" + str(value).replace("'", "''") + "'"
+
+
+def _source(path):
+    """根据扩展名生成DuckDB的表函数，支持通配符"""
+    if path.lower().endswith('.parquet'):
+        return f"read_parquet({_quote(path)})"
+    # CSV全部按字符串读取，与线上表的字符串比较语义一致
+    return f"read_csv({_quote(path)}, header = true, all_varchar = true)"
+
+
+def build_query(settle, trace, date, uid_low=80, uid_high=99, msg_type='2', limit=None):
+    """生成本地查询SQL"""
+    return QUERY.format(
+        date=str(date).replace("'", ""),
+        settle=_source(settle),
+        trace=_source(trace),
+        uid_low=int(uid_low),
+        uid_high=int(uid_high),
+        msg_type=str(msg_type).replace("'", ""),
+        limit=f"LIMIT {int(limit)}" if limit else "",
+        # 不截断时按对局和帧号排序，保证结果稳定
+        order="" if limit else "ORDER BY relayentity, deskid, deskseq, t3.chattime, openid",
+    )
+
+
+def run_local_query(settle, trace, output, date, uid_low=80, uid_high=99, msg_type='2',
+                    limit=None, threads=None):
+    """执行查询并把结果写到 output（.parquet 或 CSV），返回行数"""
+    import duckdb
+
+    con = duckdb.connect()
+    try:
+        con.execute(f"SET threads = {int(threads or os.cpu_count() or 1)}")
+        query = build_query(settle, trace, date, uid_low, uid_high, msg_type, limit)
+        if output.lower().endswith('.parquet'):
+            fmt = "FORMAT PARQUET"
+        else:
+            fmt = "FORMAT CSV, HEADER"
+        # COPY 由DuckDB直接流式写出，不经过pandas；返回写出的行数
+        rows = con.execute(f"COPY ({query}) TO {_quote(output)} ({fmt})").fetchone()[0]
+    finally:
+        con.close()
+    print(f"本地查询完成，共 {rows} 行，结果已保存到 {output}")
+    return rows
@@ -1,5 +1,10 @@
+import argparse
+import os
 import pandas as pd
 
+import profiler
+from table_io import is_columnar, read_table, write_table
+
 def convert_frames_to_min_sec(frames):
     """将帧数转换为分钟:秒格式（MM:SS）"""
     total_seconds = int(int(frames) * 66 / 1000)
@@ -8,45 +13,88 @@ def convert_frames_to_min_sec(frames):
     time_format = '%s:%s' % (minutes,seconds)
     return time_format
 
-def process_csv_to_excel(input_csv, output_excel):
+def build_process_frame(df, typed=False):
+    """
+    把原始数据转换为 A(对局key)/B(时间)/C(openid)/D(发言) 四列
+    typed=True 时B列为时长类型(timedelta)，并额外保留整数帧号列 frame，用于写出Parquet/Arrow
+    """
+    # 创建新DataFrame
+    new_df = pd.DataFrame()
+
+    # 1. 将前四列用"_"连接，放入新文件的第一列
+    new_df['A'] = df.iloc[:, 0].astype(str) + '_' + df.iloc[:, 1].astype(str) + '_' + \
+                           df.iloc[:, 2].astype(str) + '_' + df.iloc[:, 3].astype(str)
+
+    # 2. 将原文件G列(帧号)转换为时间格式，放入新文件的第二列
+    if typed:
+        frames = df.iloc[:, 6].astype('int64')
+        new_df['frame'] = frames
+        new_df['B'] = pd.to_timedelta(frames * 66 // 1000, unit='s')
+    else:
+        new_df['B'] = df.iloc[:, 6].apply(convert_frames_to_min_sec)
+
+    # 3. 将原文件E列(第5列，索引4)放入新文件的第三列
+    new_df['C'] = df.iloc[:, 4]
+
+    # 4. 将原文件F列(第6列，索引5)放入新文件的第四列
+    new_df['D'] = df.iloc[:, 5]
+
+    return new_df
+
+def process_csv_to_excel(input_csv, output_excel, seen_index=None):
     """
     处理CSV文件并生成新的Excel文件
     参数:
         input_csv: 输入的CSV文件路径
-        output_excel: 输出的Excel文件路径
+        output_excel: 输出的文件路径，.parquet/.arrow/.feather 时写出带类型的列式文件，否则写Excel
+        seen_index: 已处理行索引文件路径（SQLite），指定后只输出索引中没有的新行，成功写出后再登记
     """
+    index = None
     try:
         # 读取原始CSV文件
-        df = pd.read_csv(input_csv)
+        with profiler.stage('read_csv'):
+            df = read_table(input_csv) if is_columnar(input_csv) else pd.read_csv(input_csv)
 
         # 检查文件是否有足够的列
         required_columns = 7  # 需要至少7列才能获取G列(第7列)
         if df.shape[1] < required_columns:
             raise ValueError(f"错误：输入文件至少需要{required_columns}列，但只有{df.shape[1]}列")
 
-        # 创建新DataFrame
-        new_df = pd.DataFrame()
+        # 增量模式：跳过之前已经处理过的行
+        if seen_index:
+            from seen_index import SeenIndex
+            index = SeenIndex(seen_index)
+            with profiler.stage('seen_filter'):
+                keys = SeenIndex.row_keys(df)
+                mask = index.unseen_mask(keys)
+                df = df[mask]
+                new_keys = [key for key, is_new in zip(keys, mask) if is_new]
+            print(f"增量模式：共 {len(mask)} 行，其中新数据 {len(df)} 行")
 
-        # 1. 将前四列用"_"连接，放入新文件的第一列
-        new_df['A'] = df.iloc[:, 0].astype(str) + '_' + df.iloc[:, 1].astype(str) + '_' + \
-                               df.iloc[:, 2].astype(str) + '_' + df.iloc[:, 3].astype(str)
-
-        # 2. 将原文件G列(帧号)转换为时间格式，放入新文件的第二列
-        new_df['B'] = df.iloc[:, 6].apply(convert_frames_to_min_sec)
+        with profiler.stage('transform'):
+            new_df = build_process_frame(df, typed=is_columnar(output_excel))
+        profiler.mark('first_row')
 
-        # 3. 将原文件E列(第5列，索引4)放入新文件的第三列
-        new_df['C'] = df.iloc[:, 4]
+        # 将新DataFrame写入Excel/列式文件
+        with profiler.stage('write_output'):
+            if is_columnar(output_excel):
+                write_table(new_df, output_excel)
+            else:
+                new_df.to_excel(output_excel, index=False, engine='openpyxl')
 
-        # 4. 将原文件F列(第6列，索引5)放入新文件的第四列
-        new_df['D'] = df.iloc[:, 5]
-
-        # 将新DataFrame写入Excel文件
-        new_df.to_excel(output_excel, index=False, engine='openpyxl')
-        
         # 创建另一个Excel文件，保存F列中不是"【下发指令】"的值
-        filtered_f = df[df.iloc[:, 5] != "【下发指令】"].iloc[:, [5]]
-        output_file_filtered = output_excel.replace('.xlsx', '_filtered.xlsx')
-        filtered_f.to_excel(output_file_filtered, index=False, header=['Filtered_F_Column'], engine='openpyxl')
+        with profiler.stage('write_filtered'):
+            filtered_f = df[df.iloc[:, 5] != "【下发指令】"].iloc[:, [5]]
+            base, ext = os.path.splitext(output_excel)
+            output_file_filtered = f"{base}_filtered{ext}"
+            if is_columnar(output_excel):
+                filtered_f.columns = ['Filtered_F_Column']
+                write_table(filtered_f, output_file_filtered)
+            else:
+                filtered_f.to_excel(output_file_filtered, index=False, header=['Filtered_F_Column'], engine='openpyxl')
+
+        if index is not None:
+            index.add(new_keys)
 
         print(f"处理完成，结果已保存到 {output_excel}")
         print(f"过滤后的F列值已保存到 {output_file_filtered}")
@@ -55,10 +103,20 @@ def process_csv_to_excel(input_csv, output_excel):
     except Exception as e:
         print(f"处理过程中发生错误: {str(e)}")
         return False
+    finally:
+        # 失败时也要关闭索引，未登记的键下次会重新处理
+        if index is not None:
+            index.close()
 
 # 使用示例
 if __name__ == "__main__":
+    parser = profiler.add_profile_args(argparse.ArgumentParser(description='原始CSV转换为处理后的Excel'))
+    parser.add_argument('--seen-index', help='增量模式：已处理行索引文件（SQLite）')
+    args = parser.parse_args()
+    profiler.enable_from_args(args, 'original_process')
+
     input_file = '0729.csv'  # 替换为你的输入文件名
     output_file = '0729_process.xlsx'  # 替换为你想要的输出文件名
     
-    process_csv_to_excel(input_file, output_file)
\ No newline at end of file
+    process_csv_to_excel(input_file, output_file, args.seen_index)
+    profiler.finish()
\ No newline at end of file
@@ -0,0 +1,207 @@
+import json
+import os
+import threading
+import time
+import tracemalloc
+from contextlib import contextmanager, nullcontext
+
+
+class StageProfiler:
+    """
+    按阶段统计耗时和峰值内存，可选对指定阶段做cProfile采样
+    可在多个线程中同时使用：每个线程有自己的嵌套阶段栈，统计信息的更新加锁；
+    tracemalloc 的峰值是整个进程的，只有没有其他线程处于阶段中时才重置，并发阶段的峰值按整个进程计
+    """
+
+    def __init__(self, run_name, report_path=None, cprofile_stages=()):
+        self.run_name = run_name
+        self.report_path = report_path or f"{run_name}_profile.json"
+        self.cprofile_stages = set(cprofile_stages)
+        self.stages = {}        # 阶段名 -> 统计信息
+        self.marks = {}         # 里程碑名 -> 距运行开始的秒数
+        self._local = threading.local()   # 每个线程的嵌套阶段栈 [名称, 开始时内存, 内层峰值]
+        self._lock = threading.Lock()
+        self._running = 0       # 所有线程中正在进行的阶段数
+        self._profiles = {}     # 阶段名 -> cProfile.Profile
+        self._profiling = False # 同一时间只能有一个cProfile在采样
+        self._start = time.perf_counter()
+        self._started_tracemalloc = False
+
+    def start(self):
+        if not tracemalloc.is_tracing():
+            tracemalloc.start()
+            self._started_tracemalloc = True
+        self._start = time.perf_counter()
+        return self
+
+    @property
+    def _stack(self):
+        stack = getattr(self._local, 'stack', None)
+        if stack is None:
+            stack = self._local.stack = []
+        return stack
+
+    @contextmanager
+    def stage(self, name):
+        """统计一个命名阶段，同名阶段多次调用时累加"""
+        stack = self._stack
+        profile = None
+        with self._lock:
+            # 进入内层阶段前，把当前峰值记到外层，再重置峰值（其他线程有阶段在进行时不重置）
+            current, peak = tracemalloc.get_traced_memory()
+            if stack:
+                stack[-1][2] = max(stack[-1][2], peak)
+            if self._running == len(stack):
+                tracemalloc.reset_peak()
+            stack.append([name, current, 0])
+            self._running += 1
+
+            if name in self.cprofile_stages and not self._profiling:
+                import cProfile
+                profile = self._profiles.setdefault(name, cProfile.Profile())
+                self._profiling = True
+        if profile is not None:
+            profile.enable()
+
+        t0 = time.perf_counter()
+        try:
+            yield
+        finally:
+            elapsed = time.perf_counter() - t0
+            if profile is not None:
+                profile.disable()
+
+            with self._lock:
+                if profile is not None:
+                    self._profiling = False
+                self._running -= 1
+                _, start_mem, inner_peak = stack.pop()
+                peak = max(tracemalloc.get_traced_memory()[1], inner_peak)
+                if stack:
+                    stack[-1][2] = max(stack[-1][2], peak)
+
+                info = self.stages.setdefault(name, {
+                    'calls': 0, 'total_s': 0.0, 'max_s': 0.0,
+                    'peak_mem_mb': 0.0, 'peak_delta_mb': 0.0,
+                })
+                info['calls'] += 1
+                info['total_s'] += elapsed
+                info['max_s'] = max(info['max_s'], elapsed)
+                info['peak_mem_mb'] = max(info['peak_mem_mb'], peak / 1024 / 1024)
+                info['peak_delta_mb'] = max(info['peak_delta_mb'], (peak - start_mem) / 1024 / 1024)
+
+    def mark(self, name):
+        """记录里程碑（如首行输出时间），只记录第一次"""
+        with self._lock:
+            if name not in self.marks:
+                self.marks[name] = time.perf_counter() - self._start
+
+    def report(self):
+        """生成报告字典"""
+        total = time.perf_counter() - self._start
+        _, peak = tracemalloc.get_traced_memory()
+        return {
+            'run': self.run_name,
+            'total_s': round(total, 4),
+            'peak_mem_mb': round(max([peak / 1024 / 1024] +
+                                     [s['peak_mem_mb'] for s in self.stages.values()]), 3),
+            'marks': {k: round(v, 4) for k, v in self.marks.items()},
+            'stages': {
+                name: {k: round(v, 4) if isinstance(v, float) else v for k, v in info.items()}
+                for name, info in self.stages.items()
+            },
+        }
+
+    def write_report(self):
+        """写出JSON报告，并为采样过的阶段写出.prof文件（可用snakeviz/flameprof生成火焰图）"""
+        report = self.report()
+        base, _ = os.path.splitext(self.report_path)
+        report_dir = os.path.dirname(self.report_path)
+        if report_dir:
+            os.makedirs(report_dir, exist_ok=True)
+
+        if self._profiles:
+            import io
+            import pstats
+        for name, profile in self._profiles.items():
+            prof_path = f"{base}_{name}.prof"
+            profile.dump_stats(prof_path)
+            buf = io.StringIO()
+            pstats.Stats(profile, stream=buf).sort_stats('cumulative').print_stats(20)
+            report['stages'][name]['cprofile'] = prof_path
+            report['stages'][name]['cprofile_top'] = buf.getvalue().splitlines()
+
+        with open(self.report_path, 'w', encoding='utf-8') as f:
+            json.dump(report, f, ensure_ascii=False, indent=2)
+
+        print(f"\n[profile] {self.run_name} 总耗时 {report['total_s']:.3f}s, 峰值内存 {report['peak_mem_mb']:.1f}MB")
+        for name, info in report['stages'].items():
+            print(f"[profile]   {name:<20} 调用{info['calls']:>6}次  总计{info['total_s']:>9.3f}s  "
+                  f"最长{info['max_s']:>8.3f}s  峰值{info['peak_mem_mb']:>8.1f}MB")
+        for name, value in report['marks'].items():
+            print(f"[profile]   {name:<20} {value:.3f}s")
+        print(f"[profile] 报告已保存到 {self.report_path}")
+        return report
+
+    def stop(self):
+        if self._started_tracemalloc:
+            tracemalloc.stop()
+            self._started_tracemalloc = False
+
+
+# 当前进程启用的分析器，未启用时 stage() 不做任何事
+_active = None
+# 未启用分析器时也记录里程碑，用于统计首行耗时等
+_process_start = time.perf_counter()
+_marks = {}
+
+
+def enable(run_name, report_path=None, cprofile_stages=()):
+    global _active
+    _active = StageProfiler(run_name, report_path, cprofile_stages).start()
+    return _active
+
+
+def finish():
+    """写出报告并关闭分析器"""
+    global _active
+    if _active is None:
+        return None
+    profiler, _active = _active, None
+    report = profiler.write_report()
+    profiler.stop()
+    return report
+
+
+def stage(name):
+    if _active is None:
+        return nullcontext()
+    return _active.stage(name)
+
+
+def mark(name):
+    if name not in _marks:
+        _marks[name] = time.perf_counter() - _process_start
+    if _active is not None:
+        _active.mark(name)
+
+
+def get_mark(name):
+    """返回里程碑距进程启动的秒数，未记录时返回None"""
+    return _marks.get(name)
+
+
+def add_profile_args(parser):
+    """给命令行解析器添加 --profile / --profile-stage 参数"""
+    parser.add_argument('--profile', nargs='?', const='', default=None, metavar='REPORT',
+                        help='启用阶段耗时/内存分析，可指定报告路径（默认 <脚本名>_profile.json）')
+    parser.add_argument('--profile-stage', action='append', default=[], metavar='STAGE',
+                        help='对指定阶段额外做cProfile采样，可重复')
+    return parser
+
+
+def enable_from_args(args, run_name):
+    """根据命令行参数启用分析器"""
+    if args.profile is None:
+        return None
+    return enable(run_name, args.profile or None, args.profile_stage)
@@ -0,0 +1,79 @@
+"""
+持久化的已处理行索引，用于增量导入
+
+以 (relayentity, deskseq, openid, chattime) 作为一行聊天记录的唯一键，键的16字节哈希保存在SQLite主键表里。
+每次导入只保留索引中没有出现过的行，下游筛选和分类只处理新数据；查询是主键查找，耗时只与本次导入的行数有关。
+"""
+import hashlib
+import sqlite3
+
+import pandas as pd
+
+# 原始CSV中构成唯一键的列：relayentity, deskseq, openid, chattime
+KEY_COLUMNS = (1, 3, 4, 6)
+# 键列中空值统一写成的字符串
+NA_TOKEN = '\x00NA'
+
+
+def _key_text(column):
+    """
+    键列转为字符串：因为含空值被读成float的整数列按整数输出（123.0 -> "123"），空值统一为NA_TOKEN，
+    保证同一行在不同批次、不同文件格式下得到相同的键
+    """
+    if pd.api.types.is_float_dtype(column):
+        valid = column.dropna()
+        if (valid == valid.round()).all():
+            column = column.astype('Int64')
+    return column.astype(str).mask(column.isna(), NA_TOKEN)
+
+
+class SeenIndex:
+    """已处理行的键索引"""
+
+    def __init__(self, db_path):
+        self.db_path = db_path
+        self.conn = sqlite3.connect(db_path)
+        self.conn.execute("CREATE TABLE IF NOT EXISTS seen (key BLOB PRIMARY KEY) WITHOUT ROWID")
+        self.conn.commit()
+
+    def close(self):
+        self.conn.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    @staticmethod
+    def row_keys(df, key_columns=KEY_COLUMNS):
+        """计算每行的键（16字节哈希）"""
+        parts = [_key_text(df.iloc[:, i]) for i in key_columns]
+        joined = parts[0].str.cat(parts[1:], sep='\x1f')
+        return [hashlib.blake2b(value.encode('utf-8'), digest_size=16).digest() for value in joined]
+
+    def unseen_mask(self, keys):
+        """返回布尔列表：键不在索引中、且是本批次中第一次出现时为True"""
+        cur = self.conn.cursor()
+        cur.execute("CREATE TEMP TABLE IF NOT EXISTS batch (pos INTEGER PRIMARY KEY, key BLOB)")
+        cur.execute("DELETE FROM batch")
+        cur.executemany("INSERT INTO batch (pos, key) VALUES (?, ?)", enumerate(keys))
+        seen_pos = {pos for (pos,) in cur.execute(
+            "SELECT batch.pos FROM batch JOIN seen ON seen.key = batch.key")}
+        cur.execute("DELETE FROM batch")
+
+        mask = []
+        batch_seen = set()
+        for pos, key in enumerate(keys):
+            is_new = pos not in seen_pos and key not in batch_seen
+            batch_seen.add(key)
+            mask.append(is_new)
+        return mask
+
+    def add(self, keys):
+        """把键写入索引（应在下游结果成功写出后调用）"""
+        self.conn.executemany("INSERT OR IGNORE INTO seen (key) VALUES (?)", ((key,) for key in keys))
+        self.conn.commit()
+
+    def __len__(self):
+        return self.conn.execute("SELECT COUNT(*) FROM seen").fetchone()[0]
@@ -0,0 +1,303 @@
+"""
+基于SQLite文件的分片任务队列
+
+把输入文件（CSV/xlsx/Parquet/Arrow）按行号切成若干分片登记到队列里（切分时先转换为每个分片
+一个row group的Parquet，worker只读取自己的那部分），任意数量的worker进程
+（同一台机器或共享同一文件系统的多台机器）通过租约领取分片、定期续约、完成后写出分片结果；
+worker崩溃后租约过期，分片会被其他worker自动重新领取。最后按分片顺序合并结果。
+
+    python cli.py shard split  select_0729.xlsx --queue q.db --task classify --output-dir shards
+    python cli.py shard work   --queue q.db --processes 4      # 可在多台机器上同时运行
+    python cli.py shard status --queue q.db
+    python cli.py shard merge  --queue q.db select_0729_results.xlsx
+"""
+import json
+import logging
+import os
+import socket
+import sqlite3
+import threading
+import time
+
+from table_io import read_rows, read_table, to_parquet_row_groups, write_table
+
+logger = logging.getLogger(__name__)
+
+# 没有可领取的分片、但其他worker仍持有租约时的轮询间隔（秒）
+IDLE_POLL_SECONDS = 1
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS meta (
+    key   TEXT PRIMARY KEY,
+    value TEXT NOT NULL
+);
+CREATE TABLE IF NOT EXISTS shards (
+    shard_id    INTEGER PRIMARY KEY,
+    start_row   INTEGER NOT NULL,
+    end_row     INTEGER NOT NULL,
+    status      TEXT    NOT NULL DEFAULT 'pending',   -- pending / leased / done / failed
+    worker      TEXT,
+    lease_until REAL,
+    attempts    INTEGER NOT NULL DEFAULT 0,
+    output      TEXT,
+    error       TEXT
+);
+"""
+
+
+class ShardQueue:
+    """分片队列，所有状态都保存在一个SQLite文件中"""
+
+    def __init__(self, db_path, lease_seconds=300, max_attempts=3):
+        self.db_path = db_path
+        self.lease_seconds = lease_seconds
+        self.max_attempts = max_attempts
+        # 共享文件系统上不使用WAL（依赖共享内存），使用默认的回滚日志
+        self.conn = sqlite3.connect(db_path, timeout=60, isolation_level=None, check_same_thread=False)
+        self.conn.executescript(SCHEMA)
+        self._lock = threading.Lock()
+
+    def close(self):
+        self.conn.close()
+
+    def _write(self, sql, params=()):
+        """在写事务中执行单条语句，返回影响的行数"""
+        with self._lock:
+            self.conn.execute("BEGIN IMMEDIATE")
+            try:
+                cursor = self.conn.execute(sql, params)
+                self.conn.execute("COMMIT")
+                return cursor.rowcount
+            except Exception:
+                self.conn.execute("ROLLBACK")
+                raise
+
+    def create(self, total_rows, shard_rows, meta):
+        """登记分片，meta保存输入文件、任务类型和任务参数"""
+        if self.conn.execute("SELECT COUNT(*) FROM shards").fetchone()[0]:
+            raise ValueError(f"队列 {self.db_path} 中已有分片，请换一个队列文件")
+        with self._lock:
+            self.conn.execute("BEGIN IMMEDIATE")
+            self.conn.executemany("INSERT INTO meta (key, value) VALUES (?, ?)",
+                                  [(k, json.dumps(v, ensure_ascii=False)) for k, v in meta.items()])
+            self.conn.executemany(
+                "INSERT INTO shards (shard_id, start_row, end_row) VALUES (?, ?, ?)",
+                [(i, start, min(start + shard_rows, total_rows))
+                 for i, start in enumerate(range(0, total_rows, shard_rows))])
+            self.conn.execute("COMMIT")
+
+    def meta(self):
+        return {k: json.loads(v) for k, v in self.conn.execute("SELECT key, value FROM meta")}
+
+    def claim(self, worker_id):
+        """领取一个待处理或租约已过期的分片，没有可领取的分片时返回None"""
+        now = time.time()
+        with self._lock:
+            self.conn.execute("BEGIN IMMEDIATE")
+            try:
+                # 超过最大尝试次数且租约已过期的分片标记为失败
+                self.conn.execute(
+                    "UPDATE shards SET status = 'failed', error = COALESCE(error, 'lease expired') "
+                    "WHERE status = 'leased' AND lease_until < ? AND attempts >= ?",
+                    (now, self.max_attempts))
+                row = self.conn.execute(
+                    "SELECT shard_id, start_row, end_row, attempts FROM shards "
+                    "WHERE status = 'pending' OR (status = 'leased' AND lease_until < ?) "
+                    "ORDER BY shard_id LIMIT 1", (now,)).fetchone()
+                if row is None:
+                    self.conn.execute("COMMIT")
+                    return None
+                self.conn.execute(
+                    "UPDATE shards SET status = 'leased', worker = ?, lease_until = ?, attempts = attempts + 1 "
+                    "WHERE shard_id = ?", (worker_id, now + self.lease_seconds, row[0]))
+                self.conn.execute("COMMIT")
+            except Exception:
+                self.conn.execute("ROLLBACK")
+                raise
+        shard_id, start_row, end_row, attempts = row
+        return {'shard_id': shard_id, 'start_row': start_row, 'end_row': end_row, 'attempt': attempts + 1}
+
+    def heartbeat(self, shard_id, worker_id):
+        """续约，返回False表示租约已被收回（应停止处理该分片）"""
+        return self._write(
+            "UPDATE shards SET lease_until = ? WHERE shard_id = ? AND worker = ? AND status = 'leased'",
+            (time.time() + self.lease_seconds, shard_id, worker_id)) == 1
+
+    def complete(self, shard_id, worker_id, output):
+        return self._write(
+            "UPDATE shards SET status = 'done', output = ?, error = NULL "
+            "WHERE shard_id = ? AND worker = ? AND status = 'leased'",
+            (output, shard_id, worker_id)) == 1
+
+    def fail(self, shard_id, worker_id, error):
+        """处理失败：未超过最大尝试次数则放回队列重试"""
+        return self._write(
+            "UPDATE shards SET status = CASE WHEN attempts >= ? THEN 'failed' ELSE 'pending' END, "
+            "error = ?, lease_until = NULL WHERE shard_id = ? AND worker = ? AND status = 'leased'",
+            (self.max_attempts, str(error), shard_id, worker_id)) == 1
+
+    def status(self):
+        """各状态的分片数量"""
+        counts = {'pending': 0, 'leased': 0, 'done': 0, 'failed': 0}
+        for status, count in self.conn.execute("SELECT status, COUNT(*) FROM shards GROUP BY status"):
+            counts[status] = count
+        return counts
+
+    def outputs(self):
+        """按分片顺序返回 (shard_id, status, output)"""
+        return self.conn.execute("SELECT shard_id, status, output FROM shards ORDER BY shard_id").fetchall()
+
+
+# ---------- 分片任务 ----------
+
+def task_ingest(df, params):
+    """原始CSV分片 -> A/B/C/D 四列（original_process），B列存为时长类型，合并后可直接交给select"""
+    from original_process import build_process_frame
+    return build_process_frame(df, typed=True)
+
+
+_classifiers = {}
+
+def task_classify(df, params):
+    """对分片中的每条查询调用大模型分类，结果追加为"回复"列及校验后的"标签"、"状态"列"""
+    from Query_sort_DS_enhance import QueryClassifier, validate_labels
+
+    key = json.dumps(params, sort_keys=True)
+    if key not in _classifiers:
+        # API密钥只从worker所在机器的环境变量读取，不写入队列文件
+        classifier = QueryClassifier(os.environ.get('DEEPSEEK_API_KEY', ''), model=params['model'])
+        system_prompt = classifier.read_system_prompt(params['prompt_file'])
+        examples = classifier.get_training_examples(params['annotation_file'])
+        _classifiers[key] = (classifier, classifier.create_enhanced_prompt(system_prompt, examples))
+    classifier, enhanced_prompt = _classifiers[key]
+
+    results = []
+    for query in df[params['query_col']]:
+        query = "" if query is None or query != query else str(query).strip()
+        results.append(classifier.infer(enhanced_prompt, query) if query else "")
+    df = df.copy()
+    df['回复'] = results
+    df['标签'], df['状态'] = validate_labels(results, df[params['query_col']])
+    return df
+
+
+TASKS = {
+    'ingest': task_ingest,
+    'classify': task_classify,
+}
+
+
+# ---------- worker / 合并 ----------
+
+def split(input_path, queue_path, task, output_dir, shard_rows=1000, params=None):
+    """
+    把输入文件切分成分片并登记到队列
+    输入先转换为 output_dir/input.parquet（每个分片一个row group），worker按分片只读取对应的row group，
+    不必每个分片都从头解析CSV/xlsx
+    """
+    if task not in TASKS:
+        raise ValueError(f"未知任务 {task}，可选: {', '.join(TASKS)}")
+    os.makedirs(output_dir, exist_ok=True)
+    shard_input = os.path.join(output_dir, 'input.parquet')
+    total_rows = to_parquet_row_groups(input_path, shard_input, shard_rows)
+    queue = ShardQueue(queue_path)
+    try:
+        queue.create(total_rows, shard_rows, {
+            'input': os.path.abspath(shard_input),
+            'source': os.path.abspath(input_path),
+            'task': task,
+            'output_dir': os.path.abspath(output_dir),
+            'params': params or {},
+        })
+    finally:
+        queue.close()
+    n_shards = (total_rows + shard_rows - 1) // shard_rows
+    logger.info(f"共 {total_rows} 行，切分为 {n_shards} 个分片，队列: {queue_path}")
+    return n_shards
+
+
+def _heartbeat_loop(queue, shard_id, worker_id, stop, lost):
+    while not stop.wait(queue.lease_seconds / 3):
+        if not queue.heartbeat(shard_id, worker_id):
+            lost.set()
+            return
+
+
+def run_worker(queue_path, worker_id=None, lease_seconds=300, max_attempts=3):
+    """持续领取并处理分片，直到队列中没有可领取的分片，返回处理完成的分片数"""
+    worker_id = worker_id or f"{socket.gethostname()}:{os.getpid()}"
+    queue = ShardQueue(queue_path, lease_seconds, max_attempts)
+    meta = queue.meta()
+    task = TASKS[meta['task']]
+    done = 0
+
+    try:
+        while True:
+            shard = queue.claim(worker_id)
+            if shard is None:
+                # 其他worker还持有租约时继续等待：它们失败退回的分片很快就能接手，崩溃后租约过期也能接手
+                if queue.status()['leased']:
+                    time.sleep(IDLE_POLL_SECONDS)
+                    continue
+                break
+            shard_id = shard['shard_id']
+            logger.info(f"[{worker_id}] 领取分片 {shard_id} (行 {shard['start_row']}-{shard['end_row']}, "
+                        f"第 {shard['attempt']} 次尝试)")
+
+            stop, lost = threading.Event(), threading.Event()
+            beat = threading.Thread(target=_heartbeat_loop, args=(queue, shard_id, worker_id, stop, lost),
+                                    daemon=True)
+            beat.start()
+            try:
+                df = read_rows(meta['input'], shard['start_row'], shard['end_row'])
+                result = task(df, meta['params'])
+                if lost.is_set():
+                    logger.warning(f"[{worker_id}] 分片 {shard_id} 租约已失效，丢弃结果")
+                    continue
+                # 先写临时文件再改名，保证分片结果完整；中间结果用Parquet保留列类型
+                output = os.path.join(meta['output_dir'], f"shard_{shard_id:06d}.parquet")
+                tmp = os.path.join(meta['output_dir'],
+                                   f"shard_{shard_id:06d}.{worker_id.replace(':', '_')}.tmp.parquet")
+                write_table(result, tmp)
+                os.replace(tmp, output)
+                if queue.complete(shard_id, worker_id, output):
+                    done += 1
+            except Exception as e:
+                logger.error(f"[{worker_id}] 分片 {shard_id} 处理失败: {e}")
+                queue.fail(shard_id, worker_id, e)
+            finally:
+                stop.set()
+                beat.join()
+    finally:
+        queue.close()
+    logger.info(f"[{worker_id}] 完成 {done} 个分片")
+    return done
+
+
+def run_workers(queue_path, processes=1, lease_seconds=300, max_attempts=3):
+    """在本机启动多个worker进程"""
+    if processes <= 1:
+        return run_worker(queue_path, lease_seconds=lease_seconds, max_attempts=max_attempts)
+    from concurrent.futures import ProcessPoolExecutor
+    with ProcessPoolExecutor(processes) as pool:
+        futures = [pool.submit(run_worker, queue_path, None, lease_seconds, max_attempts)
+                   for _ in range(processes)]
+        return sum(f.result() for f in futures)
+
+
+def merge(queue_path, output_path):
+    """按分片顺序（即源文件行序）合并结果，存在未完成的分片时报错"""
+    import pandas as pd
+    queue = ShardQueue(queue_path)
+    try:
+        shards = queue.outputs()
+    finally:
+        queue.close()
+    unfinished = [shard_id for shard_id, status, _ in shards if status != 'done']
+    if unfinished:
+        raise RuntimeError(f"还有 {len(unfinished)} 个分片未完成，例如: {unfinished[:10]}")
+    frames = [read_table(output) for _, _, output in shards]
+    result = pd.concat(frames, ignore_index=True) if frames else pd.DataFrame()
+    write_table(result, output_path)
+    logger.info(f"已合并 {len(frames)} 个分片（{len(result)} 行）到 {output_path}")
+    return len(result)
@@ -0,0 +1,100 @@
+"""
+本地模拟的大模型后端，接口与 OpenAI 客户端的 client.chat.completions.create 一致，用于离线调试和测试
+
+- 回复：按 query 的哈希确定性地返回 1~5；会话/批量请求（带编号的多行）按 '编号: 标签' 逐行返回
+- 用量：模拟 DeepSeek 的前缀缓存，按 64 token 为单位缓存已见过的 prompt 前缀，
+  在 usage 中返回 prompt_cache_hit_tokens / prompt_cache_miss_tokens
+"""
+import re
+import threading
+import time
+import zlib
+from types import SimpleNamespace
+
+CACHE_BLOCK_TOKENS = 64
+_WIDE_CHARS = re.compile('[\u4e00-\u9fff\u3000-\u303f\uff00-\uffef]')
+# 每个字符的token数，按十分之一token的整数计，避免浮点累加误差
+WIDE_TENTHS = 6
+NARROW_TENTHS = 3
+
+
+def _char_tenths(ch):
+    return WIDE_TENTHS if _WIDE_CHARS.match(ch) else NARROW_TENTHS
+
+
+def count_tokens(text):
+    """
+    本地估算token数（DeepSeek文档给出的经验值）：
+    1个中文字符约0.6个token，1个英文字符/数字/符号约0.3个token
+    """
+    wide = len(_WIDE_CHARS.findall(text))
+    return (WIDE_TENTHS * wide + NARROW_TENTHS * (len(text) - wide) + 9) // 10
+
+
+def stub_label(query):
+    return str(zlib.crc32(query.strip().encode('utf-8')) % 5 + 1)
+
+
+class _Completions:
+    def __init__(self, client):
+        self._client = client
+
+    def create(self, model=None, messages=(), **kwargs):
+        return self._client._complete(messages)
+
+
+class StubClient:
+    """离线后端，latency为每次调用的模拟延迟（秒）"""
+
+    def __init__(self, latency=0.0):
+        self.latency = latency
+        self.chat = SimpleNamespace(completions=_Completions(self))
+        self._cached_prefixes = set()
+        self._lock = threading.Lock()
+
+    def _cache_lookup(self, prompt):
+        """返回命中的前缀token数，并把本次prompt的所有完整块加入缓存"""
+        # 每累计64个token切一块，块的key为从开头到块末尾的前缀哈希
+        keys = []
+        tenths = 0
+        crc = 0
+        start = 0
+        for i, ch in enumerate(prompt):
+            tenths += _char_tenths(ch)
+            # 与 count_tokens 相同的取整：前缀的token数 = count_tokens(prompt[:i + 1])
+            if (tenths + 9) // 10 >= CACHE_BLOCK_TOKENS * (len(keys) + 1):
+                crc = zlib.crc32(prompt[start:i + 1].encode('utf-8'), crc)
+                keys.append((crc, i + 1))
+                start = i + 1
+
+        hit_blocks = 0
+        with self._lock:
+            for n, key in enumerate(keys):
+                if hit_blocks == n and key in self._cached_prefixes:
+                    hit_blocks += 1
+                self._cached_prefixes.add(key)
+        return hit_blocks * CACHE_BLOCK_TOKENS
+
+    def _complete(self, messages):
+        if self.latency:
+            time.sleep(self.latency)
+        prompt = "".join(f"<{m['role']}>{m['content']}" for m in messages)
+        user = messages[-1]['content'] if messages else ""
+
+        numbered = re.findall(r'^(\d+)\.\s*(?:\[[^\]]*\]\s*)?(.*)$', user, re.M)
+        if numbered:
+            content = "\n".join(f"{n}: {stub_label(text)}" for n, text in numbered)
+        else:
+            content = stub_label(user)
+
+        prompt_tokens = count_tokens(prompt)
+        hit = min(self._cache_lookup(prompt), prompt_tokens)
+        usage = SimpleNamespace(
+            prompt_tokens=prompt_tokens,
+            completion_tokens=count_tokens(content),
+            total_tokens=prompt_tokens + count_tokens(content),
+            prompt_cache_hit_tokens=hit,
+            prompt_cache_miss_tokens=prompt_tokens - hit,
+        )
+        message = SimpleNamespace(role='assistant', content=content)
+        return SimpleNamespace(choices=[SimpleNamespace(message=message, finish_reason='stop')], usage=usage)
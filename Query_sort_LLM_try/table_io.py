@@ -0,0 +1,197 @@
+"""
+各处理阶段之间交换数据的读写工具
+
+按扩展名选择格式：
+    .parquet           列式存储，保留整数帧号和时长(duration)类型，支持列裁剪和内存映射读取
+    .arrow / .feather  Arrow IPC文件，同上
+    .xlsx / .xlsm      Excel（仅建议作为最终报表）
+    其他               CSV
+"""
+import os
+
+COLUMNAR_EXTS = ('.parquet', '.arrow', '.feather')
+EXCEL_EXTS = ('.xlsx', '.xlsm')
+
+
+def is_columnar(path):
+    return os.path.splitext(path)[1].lower() in COLUMNAR_EXTS
+
+
+def is_excel(path):
+    return os.path.splitext(path)[1].lower() in EXCEL_EXTS
+
+
+def read_table(path, columns=None):
+    """读取整张表，columns为需要的列（列式格式只读取这些列）"""
+    import pandas as pd
+    ext = os.path.splitext(path)[1].lower()
+    if ext == '.parquet':
+        import pyarrow.parquet as pq
+        return pq.read_table(path, columns=columns, memory_map=True).to_pandas()
+    if ext in ('.arrow', '.feather'):
+        import pyarrow.feather as feather
+        return feather.read_table(path, columns=columns, memory_map=True).to_pandas()
+    if ext in EXCEL_EXTS:
+        return pd.read_excel(path, usecols=columns)
+    return pd.read_csv(path, usecols=columns)
+
+
+def read_rows(path, start_row, end_row, columns=None):
+    """
+    读取 [start_row, end_row) 范围的数据行（不含表头）
+    Parquet只读取与该范围重叠的row group；CSV/xlsx每次都要从头解析，大文件应先转换为Parquet
+    """
+    import pandas as pd
+    ext = os.path.splitext(path)[1].lower()
+    nrows = end_row - start_row
+    if ext == '.parquet':
+        import pyarrow.parquet as pq
+        pf = pq.ParquetFile(path, memory_map=True)
+        groups, first, offset = [], 0, 0
+        for i in range(pf.num_row_groups):
+            size = pf.metadata.row_group(i).num_rows
+            if offset < end_row and offset + size > start_row:
+                if not groups:
+                    first = offset
+                groups.append(i)
+            offset += size
+        if not groups:
+            return pf.schema_arrow.empty_table().select(columns or pf.schema_arrow.names).to_pandas()
+        return pf.read_row_groups(groups, columns=columns).slice(start_row - first, nrows).to_pandas()
+    if ext in ('.arrow', '.feather'):
+        import pyarrow.feather as feather
+        return feather.read_table(path, columns=columns, memory_map=True).slice(start_row, nrows).to_pandas()
+    if ext in EXCEL_EXTS:
+        return pd.read_excel(path, skiprows=range(1, start_row + 1), nrows=nrows, usecols=columns)
+    return pd.read_csv(path, skiprows=range(1, start_row + 1), nrows=nrows, usecols=columns)
+
+
+_XLSX_NS = '{http://schemas.openxmlformats.org/spreadsheetml/2006/main}'
+_REL_NS = '{http://schemas.openxmlformats.org/officeDocument/2006/relationships}'
+_PKG_REL_NS = '{http://schemas.openxmlformats.org/package/2006/relationships}'
+
+
+def _active_sheet_path(zf):
+    """工作簿中活动工作表（与openpyxl的wb.active一致）在压缩包内的路径"""
+    from xml.etree import ElementTree
+    workbook = ElementTree.fromstring(zf.read('xl/workbook.xml'))
+    view = workbook.find(f'{_XLSX_NS}bookViews/{_XLSX_NS}workbookView')
+    active = int(view.get('activeTab', 0)) if view is not None else 0
+    sheets = workbook.findall(f'{_XLSX_NS}sheets/{_XLSX_NS}sheet')
+    rel_id = sheets[min(active, len(sheets) - 1)].get(f'{_REL_NS}id')
+    rels = ElementTree.fromstring(zf.read('xl/_rels/workbook.xml.rels'))
+    for rel in rels.iter(f'{_PKG_REL_NS}Relationship'):
+        if rel.get('Id') == rel_id:
+            target = rel.get('Target')
+            return target.lstrip('/') if target.startswith('/') else 'xl/' + target
+    raise ValueError(f"找不到工作表 {rel_id}")
+
+
+def iter_excel_column(path, column, min_row=2):
+    """
+    流式读取xlsx活动工作表中的一列（列字母），从 min_row 行开始，值为字符串，空单元格为None
+    直接解析工作表XML，只处理目标列，比 openpyxl 的 read_only 模式快得多；
+    行或单元格没有写 r 属性（OOXML中可省略）时，从该行起改用 openpyxl 的 read_only 模式读取
+    """
+    import zipfile
+    from xml.etree.ElementTree import iterparse
+
+    column = column.upper()
+    with zipfile.ZipFile(path) as zf:
+        shared = []
+        if 'xl/sharedStrings.xml' in zf.namelist():
+            with zf.open('xl/sharedStrings.xml') as f:
+                for _, el in iterparse(f):
+                    if el.tag == f'{_XLSX_NS}si':
+                        shared.append(''.join(t.text or '' for t in el.iter(f'{_XLSX_NS}t')))
+                        el.clear()
+
+        next_row = min_row
+        positional = False
+        with zf.open(_active_sheet_path(zf)) as f:
+            for _, el in iterparse(f):
+                if el.tag != f'{_XLSX_NS}row':
+                    continue
+                cells = el.findall(f'{_XLSX_NS}c')
+                if el.get('r') is None or any(cell.get('r') is None for cell in cells):
+                    positional = True
+                    break
+                row_idx = int(el.get('r'))
+                if row_idx >= min_row:
+                    value = None
+                    for cell in cells:
+                        if cell.get('r').rstrip('0123456789') != column:
+                            continue
+                        kind = cell.get('t')
+                        if kind == 'inlineStr':
+                            value = ''.join(t.text or '' for t in cell.iter(f'{_XLSX_NS}t'))
+                        else:
+                            v = cell.find(f'{_XLSX_NS}v')
+                            if v is not None and v.text is not None:
+                                value = shared[int(v.text)] if kind == 's' else v.text
+                        break
+                    # 中间没有写入XML的空行
+                    for _ in range(next_row, row_idx):
+                        yield None
+                    yield value or None
+                    next_row = row_idx + 1
+                el.clear()
+
+    if positional:
+        yield from _iter_excel_column_openpyxl(path, column, next_row)
+
+
+def _iter_excel_column_openpyxl(path, column, min_row):
+    """iter_excel_column 的后备实现：openpyxl按位置推算行列号，值同样转为字符串"""
+    import openpyxl
+
+    col_idx = openpyxl.utils.column_index_from_string(column)
+    wb = openpyxl.load_workbook(path, read_only=True)
+    try:
+        for (value,) in wb.active.iter_rows(min_row=min_row, min_col=col_idx, max_col=col_idx, values_only=True):
+            yield None if value is None or value == '' else str(value)
+    finally:
+        wb.close()
+
+
+def to_parquet_row_groups(path, output_path, row_group_rows):
+    """
+    把输入文件转换为每个row group最多 row_group_rows 行的Parquet，使按行范围读取只解析需要的部分
+    返回行数
+    """
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+    ext = os.path.splitext(path)[1].lower()
+    if ext == '.parquet':
+        table = pq.read_table(path, memory_map=True)
+    elif ext in ('.arrow', '.feather'):
+        import pyarrow.feather as feather
+        table = feather.read_table(path, memory_map=True)
+    else:
+        table = pa.Table.from_pandas(read_table(path), preserve_index=False)
+    pq.write_table(table, output_path, row_group_size=max(1, row_group_rows))
+    return table.num_rows
+
+
+def write_table(df, path):
+    """按扩展名写出整张表"""
+    ext = os.path.splitext(path)[1].lower()
+    if ext == '.parquet':
+        df.to_parquet(path, index=False)
+    elif ext in ('.arrow', '.feather'):
+        df.reset_index(drop=True).to_feather(path)
+    elif ext in EXCEL_EXTS:
+        df.to_excel(path, index=False)
+    else:
+        df.to_csv(path, index=False)
+
+
+def format_durations(df):
+    """把时长列转换为 M:SS 字符串，用于导出Excel报表"""
+    import pandas as pd
+    df = df.copy()
+    for col in df.columns:
+        if pd.api.types.is_timedelta64_dtype(df[col]):
+            seconds = df[col].dt.total_seconds().astype('Int64')
+            df[col] = (seconds // 60).astype(str) + ':' + (seconds % 60).astype(str).str.zfill(2)
+    return df
@@ -1,31 +1,43 @@
-import pandas as pd
-
-def read_txt_file(file_path):
-    with open(file_path, 'r', encoding='utf-8') as file:
-        lines = file.readlines()
-    return lines
-
-def process_lines(lines):
-    data = []
-    for line in lines:
-        if '->' in line:
-            text, number = line.split('->')
-            text = text.strip()
-            number = number.strip()
-            data.append((text, number))
-    return data
-
-def write_to_excel(data, output_file):
-    df = pd.DataFrame(data, columns=['Text', 'Number'])
-    df.to_excel(output_file, index=False)
+import argparse
+
+from utils import DEFAULT_CHUNK_SIZE, convert_file, convert_files, expand_inputs
+
+
+def build_parser():
+    parser = argparse.ArgumentParser(description='Convert "text -> label" files to xlsx/csv/parquet.')
+    parser.add_argument('inputs', nargs='+', help='Input text files (glob patterns allowed)')
+    output = parser.add_mutually_exclusive_group(required=True)
+    output.add_argument('-o', '--output', help='Output file for a single input (.xlsx, .csv or .parquet)')
+    output.add_argument('--output-dir', help='Output directory, one file per input')
+    parser.add_argument('--format', default='xlsx', choices=['xlsx', 'csv', 'parquet'],
+                        help='Output format used with --output-dir')
+    parser.add_argument('--workers', type=int, default=None, help='Parallel processes (default: CPU count)')
+    parser.add_argument('--chunk-size', type=int, default=DEFAULT_CHUNK_SIZE, help='Rows written per chunk')
+    return parser
+
+
+def run(args):
+    input_files = expand_inputs(args.inputs)
+    if args.output:
+        if len(input_files) != 1:
+            raise SystemExit(f'--output takes exactly one input, got {len(input_files)}; use --output-dir')
+        rows = convert_file(input_files[0], args.output, args.chunk_size)
+        print(f'{input_files[0]} -> {args.output}: {rows} rows')
+        return {input_files[0]: rows}
+
+    try:
+        results = convert_files(input_files, args.output_dir, args.format, args.workers, args.chunk_size)
+    except ValueError as e:
+        raise SystemExit(str(e))
+    for input_file, rows in results.items():
+        print(f'{input_file}: {rows} rows')
+    print(f'Converted {len(results)} files into {args.output_dir}')
+    return results
+
 
 def main():
-    input_file = 'D:\query_part.txt'  # Update with your input file path
-    output_file = 'output.xlsx'  # Desired output Excel file name
+    run(build_parser().parse_args())
 
-    lines = read_txt_file(input_file)
-    processed_data = process_lines(lines)
-    write_to_excel(processed_data, output_file)
 
 if __name__ == '__main__':
-    main()
\ No newline at end of file
+    main()
@@ -1,18 +1,192 @@
+import csv
+import glob
+import mmap
+import os
+from concurrent.futures import ProcessPoolExecutor
+
+COLUMNS = ['Text', 'Number']
+EXCEL_MAX_ROWS = 1048576  # rows per sheet, including the header
+DEFAULT_CHUNK_SIZE = 100000
+
+
+def iter_lines(file_path):
+    """Yield decoded lines from a memory-mapped file without loading it into memory."""
+    with open(file_path, 'rb') as file:
+        if os.fstat(file.fileno()).st_size == 0:
+            return
+        with mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+            for raw in iter(mm.readline, b''):
+                yield raw.decode('utf-8', errors='replace')
+
+
+def parse_line(line):
+    """Split "text -> label" on the last "->", so arrows inside the text are kept."""
+    if '->' not in line:
+        return None
+    text, _, number = line.rpartition('->')
+    return text.strip().lstrip('\ufeff'), number.strip()
+
+
+def iter_records(file_path):
+    for line in iter_lines(file_path):
+        record = parse_line(line)
+        if record is not None:
+            yield record
+
+
+def iter_chunks(records, chunk_size=DEFAULT_CHUNK_SIZE):
+    chunk = []
+    for record in records:
+        chunk.append(record)
+        if len(chunk) >= chunk_size:
+            yield chunk
+            chunk = []
+    if chunk:
+        yield chunk
+
+
+class CsvSink:
+    def __init__(self, output_file):
+        self.file = open(output_file, 'w', encoding='utf-8-sig', newline='')
+        self.writer = csv.writer(self.file)
+        self.writer.writerow(COLUMNS)
+
+    def write(self, chunk):
+        self.writer.writerows(chunk)
+
+    def close(self):
+        self.file.close()
+
+
+class ParquetSink:
+    def __init__(self, output_file):
+        import pyarrow as pa
+        import pyarrow.parquet as pq
+        self.pa = pa
+        self.schema = pa.schema([(name, pa.string()) for name in COLUMNS])
+        self.writer = pq.ParquetWriter(output_file, self.schema)
+
+    def write(self, chunk):
+        texts, numbers = zip(*chunk)
+        self.writer.write_table(self.pa.table([list(texts), list(numbers)], schema=self.schema))
+
+    def close(self):
+        self.writer.close()
+
+
+class ExcelSink:
+    """Write-only workbook; starts a new sheet when one fills up."""
+
+    def __init__(self, output_file):
+        from openpyxl import Workbook
+        self.output_file = output_file
+        self.workbook = Workbook(write_only=True)
+        self.sheet = None
+        self.sheet_rows = 0
+
+    def _new_sheet(self):
+        self.sheet = self.workbook.create_sheet(f'Sheet{len(self.workbook.worksheets) + 1}')
+        self.sheet.append(COLUMNS)
+        self.sheet_rows = 1
+
+    def write(self, chunk):
+        for record in chunk:
+            if self.sheet is None or self.sheet_rows >= EXCEL_MAX_ROWS:
+                self._new_sheet()
+            self.sheet.append(record)
+            self.sheet_rows += 1
+
+    def close(self):
+        if self.sheet is None:
+            self._new_sheet()
+        self.workbook.save(self.output_file)
+
+
+SINKS = {
+    '.csv': CsvSink,
+    '.parquet': ParquetSink,
+    '.xlsx': ExcelSink,
+}
+
+
+def open_sink(output_file):
+    ext = os.path.splitext(output_file)[1].lower()
+    if ext not in SINKS:
+        raise ValueError(f'Unsupported output format: {output_file} (use .xlsx, .csv or .parquet)')
+    return SINKS[ext](output_file)
+
+
+def convert_file(input_file, output_file, chunk_size=DEFAULT_CHUNK_SIZE):
+    """Stream one "text -> label" file into the sink chosen by the output extension."""
+    sink = open_sink(output_file)
+    rows = 0
+    try:
+        for chunk in iter_chunks(iter_records(input_file), chunk_size):
+            sink.write(chunk)
+            rows += len(chunk)
+    finally:
+        sink.close()
+    return rows
+
+
+def expand_inputs(patterns):
+    files = []
+    for pattern in patterns:
+        matches = sorted(glob.glob(pattern))
+        files.extend(matches if matches else [pattern])
+    return files
+
+
+def output_paths(input_files, output_dir, fmt):
+    """Map inputs to outputs, keeping each input's path relative to the inputs' common directory.
+
+    Inputs from different directories (e.g. logs/*/*.txt) keep their subdirectories, so
+    same-named files do not overwrite each other. Inputs that still map to the same output
+    (a.txt and a.log) are rejected.
+    """
+    sources = [os.path.abspath(f) for f in input_files]
+    base = os.path.commonpath([os.path.dirname(f) for f in sources]) if sources else ''
+    outputs, seen = [], {}
+    for input_file, source in zip(input_files, sources):
+        name = os.path.splitext(os.path.relpath(source, base))[0]
+        output = os.path.join(output_dir, f'{name}.{fmt}')
+        if output in seen:
+            raise ValueError(f'{seen[output]} and {input_file} would both be written to {output}')
+        seen[output] = input_file
+        outputs.append(output)
+    return outputs
+
+
+def convert_files(input_files, output_dir, fmt='xlsx', workers=None, chunk_size=DEFAULT_CHUNK_SIZE):
+    """Convert many files in parallel, one output per input. Returns {input_file: rows}."""
+    jobs = list(zip(input_files, output_paths(input_files, output_dir, fmt)))
+    for _, output in jobs:
+        os.makedirs(os.path.dirname(output) or '.', exist_ok=True)
+
+    if len(jobs) <= 1 or workers == 1:
+        return {src: convert_file(src, dst, chunk_size) for src, dst in jobs}
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        futures = {src: pool.submit(convert_file, src, dst, chunk_size) for src, dst in jobs}
+        return {src: future.result() for src, future in futures.items()}
+
+
+# Kept for callers of the original list-based helpers.
 def read_txt_file(file_path):
-    with open(file_path, 'r', encoding='utf-8') as file:
-        lines = file.readlines()
-    return lines
+    return list(iter_lines(file_path))
+
 
 def process_lines(lines):
     processed_data = []
     for line in lines:
-        if '->' in line:
-            text, number = line.split('->')
-            processed_data.append((text.strip(), number.strip()))
+        record = parse_line(line)
+        if record is not None:
+            processed_data.append(record)
     return processed_data
 
+
 def write_to_excel(data, output_file):
-    import pandas as pd
-    
-    df = pd.DataFrame(data, columns=['Text', 'Number'])
-    df.to_excel(output_file, index=False)
\ No newline at end of file
+    sink = open_sink(output_file)
+    try:
+        sink.write(data)
+    finally:
+        sink.close()